@@ -3,17 +3,18 @@ from copy import deepcopy
 from enum import StrEnum
 from langfuse import observe
 import logging
-from typing import List
+from typing import AsyncIterator, List, Tuple
 
 from config import CONFIG
-from mem1 import Mem1
+from mem1 import DEFAULT_SESSION_ID, DEFAULT_USER_ID, Mem1
 
 from .infra.database import DBStore
-from .infra.database.schema import Message, ChatSummary
+from .infra.database.schema import Message
 from .infra.embedder import Embedder
 from .infra.inference import Inference
 from .infra.graph_db import GraphDB
 from .infra.vector_db import VectorSearch
+from .utils.context_utils import ContextManager
 from .utils.prompts import SYSTEM_PROMPT
 
 
@@ -24,7 +25,14 @@ class AssistantException(Exception): ...
 
 
 class Assistant:
-    def __init__(self):
+    def __init__(
+        self,
+        user_id: str = DEFAULT_USER_ID,
+        session_id: str = DEFAULT_SESSION_ID,
+    ):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.conversation_id = self._get_conversation_id(user_id, session_id)
         self.inference_instance = Inference()
         self.embedder = Embedder()
         self.mem1_client = Mem1(
@@ -33,21 +41,54 @@ class Assistant:
             vector_db_client=VectorSearch.get_client(),
             vector_db_collection=CONFIG.QDRANT_COLLECTION,
             embedder_client=self.embedder.get_client(),
+            # Only the TEI backend is labelled with the configured model name.
+            embedding_model=(
+                CONFIG.EMBEDDING_MODEL if CONFIG.EMBEDDING_BACKEND == "tei" else None
+            ),
+            embedder_backend=self.embedder.get_backend(),
+            local_vector_store_path=(
+                CONFIG.LOCAL_VECTOR_STORE_PATH
+                if CONFIG.VECTOR_STORE == "local"
+                else None
+            ),
             database_client=DBStore.get_client(),
-            database_collection=ChatSummary,
+            database_name=CONFIG.MONGO_MSG_DB,
             graph_db_client=GraphDB.get_client(),
             message_interval_for_summary=2,
             max_messages_for_new_fact=2,
+            memory_injection_mode=CONFIG.MEMORY_INJECTION,
+            extraction_gate_threshold=CONFIG.EXTRACTION_GATE_THRESHOLD,
+        )
+        self.context_manager = ContextManager()
+
+    def _get_conversation_id(self, user_id: str, session_id: str) -> str:
+        return f"{user_id}:{session_id}"
+
+    async def setup(self):
+        await self.mem1_client.setup()
+        await DBStore.migrate_messages(
+            self._get_conversation_id(DEFAULT_USER_ID, DEFAULT_SESSION_ID)
         )
 
     # @observe()
-    async def _get_context_with_current_msg(self, query: str) -> List[Message]:
+    async def _get_context_with_current_msg(
+        self, query: str
+    ) -> Tuple[List[Message], bool]:
+        # Also returns whether older messages were left out by the history window.
         try:
-            prev_msgs = await DBStore.get_messages()
+            # NOTE: One message more than the window is read, only to tell whether
+            # there are older messages than the window.
+            prev_msgs = await DBStore.get_messages(
+                self.conversation_id, limit=CONFIG.HISTORY_WINDOW + 1
+            )
+            is_truncated = len(prev_msgs) > CONFIG.HISTORY_WINDOW
+            if is_truncated:
+                prev_msgs = prev_msgs[1:]
             prev_msgs = [
                 Message(
                     role=msg.role,
                     content=msg.content,
+                    created_at=msg.created_at,
                 )
                 for msg in prev_msgs
             ]
@@ -58,23 +99,13 @@ class Assistant:
             )
             prev_msgs.append(user_msg)
 
-            return prev_msgs
+            return prev_msgs, is_truncated
 
         except Exception as e:
             raise AssistantException(
                 f"Failed to build context for reply. Error: {str(e)}"
             )
 
-    # @observe()
-    def _prepend_system_message(self, msgs: List[Message]):
-        system_msg = Message(
-            role="system",
-            content=SYSTEM_PROMPT,
-        )
-        msgs_copied = deepcopy(msgs)
-        msgs_copied.insert(0, system_msg)
-        return msgs_copied
-
     def _add_assistant_message_to_msgs(
         self, msgs: List[Message], assistant_msg: str
     ) -> List[Message]:
@@ -86,35 +117,83 @@ class Assistant:
         msgs_copied.append(assistant_msg_model)
         return msgs_copied
 
-    # @observe()
-    async def reply(self, query: str) -> str:
-        try:
-            msgs_to_send = await self._get_context_with_current_msg(query)
+    async def _build_messages(self, query: str) -> Tuple[List[Message], List[Message]]:
+        # Returns the conversation with the current query, and the messages to send
+        # to the model (the same, fitted into the context and with memories).
+        # History and memories are independent reads, so fetch them together.
+        (msgs_to_send, is_truncated), memory_context = await asyncio.gather(
+            self._get_context_with_current_msg(query),
+            self.mem1_client.retrieve_memory_context(
+                query, user_id=self.user_id, session_id=self.session_id
+            ),
+        )
+        # NOTE: Read after `retrieve_memory_context`, which waits for the previous
+        # turn's memory ops, so the summary already covers that turn.
+        summary = await self.mem1_client.get_summary(
+            user_id=self.user_id, session_id=self.session_id
+        )
 
-            msgs_to_send_with_sys_msg = self._prepend_system_message(msgs_to_send)
+        # Fitting everything into the context length. The summary is only used
+        # when older turns are missing, either cut by the history window or dropped
+        # to fit.
+        msgs_in_budget, memory_context = self.context_manager.build_context(
+            SYSTEM_PROMPT,
+            msgs_to_send,
+            memory_context,
+            summary,
+            history_truncated=is_truncated,
+        )
 
-            # Loading memory into the context here.
-            msgs_with_memories = await self.mem1_client.load_memory(
-                msgs_to_send_with_sys_msg
-            )
-            logger.info(f"Context: {msgs_with_memories}")
+        # Loading memory into the context here.
+        msgs_with_memories = self.mem1_client.inject_memory(
+            msgs_in_budget, memory_context
+        )
+        logger.info(f"Context: {msgs_with_memories}")
+        return msgs_to_send, msgs_with_memories
+
+    async def _save_turn(self, msgs_to_send: List[Message], response: str):
+        # The last two are the user message of this turn and the reply.
+        msgs_to_send = self._add_assistant_message_to_msgs(msgs_to_send, response)
+        await DBStore.store_messages(self.conversation_id, msgs_to_send[-2:])
 
+        # Processing memory in the background, so the reply is not held up by it.
+        self.mem1_client.submit_memory(
+            msgs_to_send, user_id=self.user_id, session_id=self.session_id
+        )
+
+    # @observe()
+    async def reply(self, query: str) -> str:
+        try:
+            msgs_to_send, msgs_with_memories = await self._build_messages(query)
             response = await self.inference_instance.run(msgs_with_memories)
+            await self._save_turn(msgs_to_send, response)
+            return response
 
-            await DBStore.store_message(
-                role="user",
-                content=query,
-            )
-            await DBStore.store_message(
-                role="assistant",
-                content=response,
-            )
+        except Exception as e:
+            raise AssistantException(f"Failed to process reply. Error: {str(e)}")
+
+    async def reply_stream(self, query: str) -> AsyncIterator[str]:
+        # Same as `reply`, but yields the response as it is generated. The turn is
+        # saved and sent for memory processing once the stream is finished.
+        try:
+            msgs_to_send, msgs_with_memories = await self._build_messages(query)
 
-            # Processing memory here.
-            msgs_to_send = self._add_assistant_message_to_msgs(msgs_to_send, response)
-            await self.mem1_client.process_memory(msgs_to_send)
+            chunks = []
+            async for delta in self.inference_instance.stream(msgs_with_memories):
+                chunks.append(delta)
+                yield delta
 
-            return response
+            await self._save_turn(msgs_to_send, "".join(chunks))
 
         except Exception as e:
             raise AssistantException(f"Failed to process reply. Error: {str(e)}")
+
+    async def reset(self):
+        # NOTE: For now, we will simply clear the messages and the memories instead of
+        # changing the thread and retaining the previous messages.
+        await DBStore.delete_messages(self.conversation_id)
+        await self.mem1_client.delete_user_data(user_id=self.user_id)
+
+    async def close(self):
+        # Drains pending memory ops before the application exits.
+        await self.mem1_client.aclose()
@@ -1,10 +1,10 @@
 import asyncio
 import logging
-from typing import Literal
+from typing import List, Literal, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
+from beanie import SortDirection, init_beanie
 from config import CONFIG
-from .schema import Message, ChatSummary
+from .schema import Message, MessageView
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +24,6 @@ class _DBStore:
                 database=self.client.get_database(CONFIG.MONGO_MSG_DB),
                 document_models=[
                     Message,
-                    ChatSummary,
                 ],
             )
             logger.info(f"MongoDB setup completed!")
@@ -37,40 +36,85 @@ class _DBStore:
             logger.error(f"Database client not found. Initialize it first.")
         return self.client
 
-    # Message Methods
-    async def store_message(
-        self, role: Literal["system", "user", "assistant"], content: str
-    ):
+    async def migrate_messages(self, default_conversation_id: str):
+        # Messages stored before conversations existed have no `conversation_id`
+        # and a JSON-quoted ISO string as `created_at`.
         if self.client is None:
             logger.error(f"DB client is not initialized. Initialize if first.")
             raise Exception(f"DB client is not initialized. Initialize if first.")
 
-        message = Message(
-            role=role,
-            content=content,
+        collection = Message.get_pymongo_collection()
+        await collection.update_many(
+            {"conversation_id": {"$exists": False}},
+            {"$set": {"conversation_id": default_conversation_id}},
+        )
+        await collection.update_many(
+            {"created_at": {"$type": "string"}},
+            [
+                {
+                    "$set": {
+                        "created_at": {
+                            "$toDate": {"$trim": {"input": "$created_at", "chars": '"'}}
+                        }
+                    }
+                }
+            ],
         )
-        await message.insert()
 
-    async def get_messages(self):
+    # Message Methods
+    async def store_messages(self, conversation_id: str, messages: List[Message]):
+        # Stores the messages of a turn in a single round trip, in the given order.
+        # NOTE: Their `created_at` is kept as is, so Mem1's extraction watermark
+        # matches the stored messages when they are read back.
         if self.client is None:
             logger.error(f"DB client is not initialized. Initialize if first.")
             raise Exception(f"DB client is not initialized. Initialize if first.")
 
-        return await Message.find_all().to_list()
+        for message in messages:
+            message.conversation_id = conversation_id
+        await Message.insert_many(messages)
 
-    async def delete_messages(self):
+    async def store_message(
+        self,
+        conversation_id: str,
+        role: Literal["system", "user", "assistant"],
+        content: str,
+    ):
+        await self.store_messages(
+            conversation_id, [Message(role=role, content=content)]
+        )
+
+    async def get_messages(
+        self, conversation_id: str, limit: int = CONFIG.HISTORY_WINDOW
+    ) -> List[MessageView]:
+        # Returns the last `limit` messages of the conversation, oldest first.
         if self.client is None:
             logger.error(f"DB client is not initialized. Initialize if first.")
             raise Exception(f"DB client is not initialized. Initialize if first.")
 
-        await Message.find_all().delete()
+        latest = (
+            await Message.find(Message.conversation_id == conversation_id)
+            .sort(
+                (Message.created_at, SortDirection.DESCENDING),
+                (Message.id, SortDirection.DESCENDING),
+            )
+            .limit(limit)
+            .project(MessageView)
+            .to_list()
+        )
+        latest.reverse()
+        return latest
 
-    async def delete_summary(self):
+    async def delete_messages(self, conversation_id: Optional[str] = None):
+        # Deletes the messages of the conversation, or all of them if none is given.
         if self.client is None:
             logger.error(f"DB client is not initialized. Initialize if first.")
             raise Exception(f"DB client is not initialized. Initialize if first.")
 
-        await ChatSummary.find_all().delete()
+        if conversation_id is None:
+            await Message.find_all().delete()
+        else:
+            await Message.find(Message.conversation_id == conversation_id).delete()
 
 
 # NOTE: Also can move this or keep it here.
@@ -1,21 +1,33 @@
-import json
 from beanie import Document
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from typing import Optional, Literal
-from datetime import datetime
 
 
 class Message(Document):
     role: Literal["system", "user", "assistant"]
     content: str
-    created_at: str = json.dumps(datetime.utcnow().isoformat())
+    conversation_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     class Settings:
         name = "messages"
+        # NOTE: Mongo keeps timestamps at millisecond precision, so `_id` breaks ties
+        # between the messages of a turn, which are inserted together.
+        indexes = [
+            IndexModel(
+                [
+                    ("conversation_id", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            )
+        ]
 
 
-class ChatSummary(Document):
-    # For now, only storing the summary here
-    summary: str
-
-    class Settings:
-        name = "chat_summary"
+class MessageView(BaseModel):
+    # Projection used when reading the history back into the context.
+    role: Literal["system", "user", "assistant"]
+    content: str
+    created_at: datetime
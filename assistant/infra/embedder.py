@@ -4,6 +4,11 @@ import logging
 from typing import List, Optional
 
 from config import CONFIG
+from mem1.infra.embedding_backends import (
+    EmbeddingBackend,
+    HashingEmbeddingBackend,
+    ONNXEmbeddingBackend,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -25,3 +30,14 @@ class Embedder:
             logger.error(f"Embedder client not found. Initialize it first.")
             raise EmbedderException(f"Embedder client not found. Initialize it first.")
         return self.client
+
+    def get_backend(self) -> Optional[EmbeddingBackend]:
+        # None means Mem1 talks to the TEI server through `get_client()`.
+        if CONFIG.EMBEDDING_BACKEND == "onnx":
+            return ONNXEmbeddingBackend(
+                model_dir=CONFIG.EMBEDDING_MODEL_DIR,
+                model_name=CONFIG.EMBEDDING_MODEL,
+            )
+        if CONFIG.EMBEDDING_BACKEND == "hashing":
+            return HashingEmbeddingBackend(dimension=CONFIG.QDRANT_DIMENSION_SIZE)
+        return None
@@ -6,7 +6,10 @@ from config import CONFIG
 class _GraphDB:
     def __init__(self):
         self.driver = AsyncGraphDatabase.driver(
-            CONFIG.GRAPHDB_URL, auth=(CONFIG.GRAPHDB_USER, CONFIG.GRAPHDB_PASS)
+            CONFIG.GRAPHDB_URL,
+            auth=(CONFIG.GRAPHDB_USER, CONFIG.GRAPHDB_PASS),
+            max_connection_pool_size=CONFIG.GRAPHDB_POOL_SIZE,
+            max_transaction_retry_time=CONFIG.GRAPHDB_MAX_RETRY_TIME,
         )
 
     async def close(self):
@@ -1,9 +1,11 @@
 import asyncio
+import logging
+import time
 from langfuse import observe
 from langfuse.openai import AsyncOpenAI
 
 # from llama_cpp import Llama
-from typing import Dict, List, Protocol
+from typing import AsyncIterator, Dict, List, Protocol
 
 from config import CONFIG
 from assistant.models import Message, LLMResponse
@@ -11,12 +13,30 @@ from assistant.models import Message, LLMResponse
 from .database.schema import Message
 
 
+logger = logging.getLogger(__name__)
+
+
 class InferenceException(Exception): ...
 
 
+def log_usage(usage):
+    # Cached tokens are the prompt prefix served from the provider's KV cache.
+    if usage is None:
+        return
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (details.cached_tokens if details else None) or 0
+    logger.info(
+        f"Prompt tokens: {usage.prompt_tokens} (cached: {cached_tokens}), "
+        f"completion tokens: {usage.completion_tokens}"
+    )
+
+
 class BaseInference(Protocol):
     async def run(self, msgs: List[Dict]) -> str: ...
 
+    def stream(self, msgs: List[Dict]) -> AsyncIterator[str]: ...
+
     def get_client(self): ...
 
 
@@ -63,11 +83,46 @@ class OpenAIInference(BaseInference):
                 messages=msgs,
                 temperature=CONFIG.MODEL_TEMP,
             )
+            log_usage(response.usage)
             return response.choices[0].message.content
 
         except Exception as e:
             raise InferenceException(f"OpenAI inference failed. Error: {str(e)}")
 
+    async def stream(self, msgs: List[Dict]) -> AsyncIterator[str]:
+        # Yields the content deltas as they arrive and logs the time to first token.
+        try:
+            started_at = time.perf_counter()
+            first_token_at = None
+            response = await self.openai_client.chat.completions.create(
+                model=CONFIG.MODEL_NAME,
+                messages=msgs,
+                temperature=CONFIG.MODEL_TEMP,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in response:
+                # NOTE: With `include_usage`, the last chunk has the usage and no choices.
+                if chunk.usage is not None:
+                    log_usage(chunk.usage)
+
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    logger.info(
+                        f"Time to first token: {first_token_at - started_at:.3f}s"
+                    )
+                yield chunk.choices[0].delta.content
+
+            logger.info(f"Streamed response in {time.perf_counter() - started_at:.3f}s")
+
+        except Exception as e:
+            raise InferenceException(
+                f"OpenAI streaming inference failed. Error: {str(e)}"
+            )
+
     def get_client(self):
         return self.openai_client
 
@@ -94,9 +149,19 @@ class Inference:
                 f"Inference instance was not initiated successfully."
             )
 
-        msgs_to_send = [msg.model_dump() for msg in msgs]
+        msgs_to_send = [msg.model_dump(include={"role", "content"}) for msg in msgs]
         return await self.client_instance.run(msgs_to_send)
 
+    async def stream(self, msgs: List[Message]) -> AsyncIterator[str]:
+        if self.client_instance is None:
+            raise InferenceException(
+                f"Inference instance was not initiated successfully."
+            )
+
+        msgs_to_send = [msg.model_dump(include={"role", "content"}) for msg in msgs]
+        async for delta in self.client_instance.stream(msgs_to_send):
+            yield delta
+
     def get_client(self):
         if self.client_instance is None:
             raise InferenceException(
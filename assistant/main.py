@@ -24,9 +24,10 @@ async def main():
     await VectorSearch.setup()
     # init_langfuse()  # Uncomment when ready to use Langfuse
     assistant = Assistant()
+    await assistant.setup()
 
     print("Application started!", file=sys.stderr)
-    logger.debug("Application started. DB and VectorSearch are setup.")
+    logger.debug("Application started. DB, VectorSearch and GraphDB are setup.")
 
     print(READY_PROMPT, flush=True)
 
@@ -45,14 +46,15 @@ async def main():
                 continue
 
             if user_query.lower() in [sp_cmd.value for sp_cmd in SPECIAL_COMMANDS]:
-                await handle_commands(user_query)
+                await handle_commands(user_query, assistant)
                 break
 
             print("Thinking...", file=sys.stderr, flush=True)
 
-            response = await assistant.reply(user_query)
-
-            print(response, flush=True)
+            # Printing the response as it is generated.
+            async for delta in assistant.reply_stream(user_query):
+                print(delta, end="", flush=True)
+            print(flush=True)
 
             print(READY_PROMPT, flush=True)
 
@@ -69,6 +71,8 @@ async def main():
             print(f"Critical error: {e}", file=sys.stderr, flush=True)
             print(READY_PROMPT, flush=True)
 
+    # Let the pending memory ops finish before exiting.
+    await assistant.close()
     logger.info("Application shutting down.")
 
 
@@ -1,4 +1,145 @@
-# This file will have functions to manage messages in the context.
-# Basically, cut-short the message stream based on the given context length.
-# And check if the messages have alternating roles.
-# Too lazy to do it right now (╥‸╥) Will do it later.
+# Fits the context sent to the model into `CTX_LENGTH` tokens.
+# The budget is split across the system prompt, memories, chat summary and recent turns:
+# the system prompt is always kept, memories and summary get a fixed share each, and
+# the recent turns get the rest (newest first). When older turns don't fit, the
+# Mem1 chat summary stands in for them.
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from config import CONFIG
+from mem1.utils.cache import LRUCache
+from mem1.utils.tokens import estimate_tokens, trim_to_token_budget
+
+from ..infra.database.schema import Message
+
+
+logger = logging.getLogger(__name__)
+
+# NOTE: Roughly what the chat template adds around each message (role, delimiters).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Opening and closing tag lines of blocks like `<Memory-Block>`.
+_TAG_LINE_PATTERN = re.compile(r"^</?[\w-]+>$")
+
+
+class ContextManager:
+    def __init__(
+        self,
+        ctx_length: int = CONFIG.CTX_LENGTH,
+        reply_tokens: int = CONFIG.CTX_REPLY_TOKENS,
+        memory_share: float = 0.2,
+        summary_share: float = 0.1,
+        token_cache_size: int = 4096,
+    ):
+        self.ctx_length = ctx_length
+        self.reply_tokens = reply_tokens
+        self.memory_share = memory_share
+        self.summary_share = summary_share
+        # (role, content) -> token count, so the history isn't re-counted every turn.
+        self._token_cache = LRUCache(max_size=token_cache_size)
+
+    def count_message_tokens(self, msg: Message) -> int:
+        key = (msg.role, msg.content)
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            tokens = estimate_tokens(msg.content) + MESSAGE_OVERHEAD_TOKENS
+            self._token_cache.set(key, tokens)
+        return tokens
+
+    def _trim_block(self, text: str, budget: int) -> str:
+        # Drops the last lines that don't fit. Tag lines are always kept (and
+        # budgeted first), so trimmed blocks stay well-formed.
+        if estimate_tokens(text) <= budget:
+            return text
+
+        lines = text.split("\n")
+        is_tag = [bool(_TAG_LINE_PATTERN.match(line.strip())) for line in lines]
+        tag_tokens = sum(
+            estimate_tokens(line) + 1 for line, tag in zip(lines, is_tag) if tag
+        )
+        kept = len(
+            trim_to_token_budget(
+                [line for line, tag in zip(lines, is_tag) if not tag],
+                budget - tag_tokens,
+            )
+        )
+
+        trimmed = []
+        for line, tag in zip(lines, is_tag):
+            if tag:
+                # NOTE: A block that lost all its lines is dropped with its tags.
+                if (
+                    line.strip().startswith("</")
+                    and trimmed
+                    and trimmed[-1] == ("<" + line.strip()[2:])
+                ):
+                    trimmed.pop()
+                else:
+                    trimmed.append(line)
+            elif kept:
+                trimmed.append(line)
+                kept -= 1
+        return "\n".join(trimmed)
+
+    def _fit_turns(self, messages: List[Message], budget: int) -> List[Message]:
+        # Keeps the newest messages that fit. The last one (current query) is always kept.
+        kept = []
+        used = 0
+        for msg in reversed(messages):
+            tokens = self.count_message_tokens(msg)
+            if kept and used + tokens > budget:
+                break
+            kept.append(msg)
+            used += tokens
+        kept.reverse()
+
+        # NOTE: Don't start the window in the middle of a turn.
+        while len(kept) > 1 and kept[0].role != "user":
+            kept.pop(0)
+        return kept
+
+    def build_context(
+        self,
+        system_prompt: str,
+        messages: List[Message],
+        memory_context: str = "",
+        summary: Optional[str] = None,
+        history_truncated: bool = False,
+    ) -> Tuple[List[Message], str]:
+        # Returns the messages to send (system message first) and the memory context
+        # to inject: memories trimmed to their share, led by the summary if it's needed,
+        # i.e. when older turns are missing. `history_truncated` tells that `messages`
+        # doesn't start at the beginning of the conversation.
+        # NOTE: The system message is left as the static `system_prompt`, so that it
+        # stays cacheable. Everything that changes goes in the memory context.
+        budget = self.ctx_length - self.reply_tokens
+        memory_context = self._trim_block(
+            memory_context, int(budget * self.memory_share)
+        )
+        system_msg = Message(role="system", content=system_prompt)
+        available = (
+            budget
+            - self.count_message_tokens(system_msg)
+            - estimate_tokens(memory_context)
+        )
+
+        turns = self._fit_turns(messages, available)
+        if (history_truncated or len(turns) < len(messages)) and summary:
+            # NOTE: The summary is usually a single paragraph, so it's cut by
+            # characters (~4 per token) rather than by lines.
+            summary = summary[: int(budget * self.summary_share) * 4]
+            summary_block = (
+                f"\n<Conversation-Summary>\n{summary}\n</Conversation-Summary>"
+            )
+            turns = self._fit_turns(turns, available - estimate_tokens(summary_block))
+            memory_context = summary_block + memory_context
+
+        if len(turns) < len(messages):
+            logger.info(
+                f"Dropped {len(messages) - len(turns)}/{len(messages)} messages to fit the context."
+            )
+        return [system_msg, *turns], memory_context
+
+    def stats(self):
+        return self._token_cache.stats()
@@ -1,9 +1,10 @@
 import asyncio
 from enum import StrEnum
 import logging
+from typing import TYPE_CHECKING
 
-from ..infra.database import DBStore
-from ..infra.vector_db import VectorSearch
+if TYPE_CHECKING:
+    from ..assistant import Assistant
 
 
 logger = logging.getLogger(__name__)
@@ -14,7 +15,7 @@ class SPECIAL_COMMANDS(StrEnum):
     RESET = "/reset"
 
 
-async def handle_commands(query: str):
+async def handle_commands(query: str, assistant: "Assistant"):
     try:
         match query:
             case SPECIAL_COMMANDS.EXIT.value:
@@ -23,11 +24,10 @@ async def handle_commands(query: str):
                 return
 
             case SPECIAL_COMMANDS.RESET.value:
-                # NOTE: For now, we will simply clear all the messages from the DB
-                # instead of changing the thread and retaining the previous messages.
+                # NOTE: Goes through Mem1, so the facts are cleared from whichever
+                # vector store it uses (Qdrant or the local one).
                 logger.info(f"User reset the context.")
-                await DBStore.delete_messages()
-                await VectorSearch.delete_all_points()
+                await assistant.reset()
                 print("\nContext cleared!\n")
 
             case _:
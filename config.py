@@ -6,6 +6,8 @@ from pydantic import Field
 class _CONFIG(BaseSettings):
     MODEL_PATH: str
     CTX_LENGTH: int = Field(default=32768)
+    CTX_REPLY_TOKENS: int = Field(default=1024)
+    HISTORY_WINDOW: int = Field(default=20)
 
     MODEL_TEMP: float = Field(default=1.0)
     MODEL_NAME: str
@@ -13,6 +15,10 @@ class _CONFIG(BaseSettings):
     MODEL_API_KEY: str
 
     INFERENCE_TYPE: Literal["local", "api"] = Field(default="api")
+    MEMORY_INJECTION: Literal["system_prompt", "late_message"] = Field(
+        default="late_message"
+    )
+    EXTRACTION_GATE_THRESHOLD: float = Field(default=0.4)
 
     MONGO_USER: str
     MONGO_PASS: str
@@ -24,14 +30,21 @@ class _CONFIG(BaseSettings):
 
     EMBEDDING_URL: str
     EMBEDDING_MODEL: str
+    EMBEDDING_BACKEND: Literal["tei", "onnx", "hashing"] = Field(default="tei")
+    EMBEDDING_MODEL_DIR: str = Field(default="models/embedder")
 
     QDRANT_URL: str
     QDRANT_COLLECTION: str
     QDRANT_DIMENSION_SIZE: int
 
+    VECTOR_STORE: Literal["qdrant", "local"] = Field(default="qdrant")
+    LOCAL_VECTOR_STORE_PATH: str = Field(default="data/vectors")
+
     GRAPHDB_URL: str
     GRAPHDB_USER: str
     GRAPHDB_PASS: str
+    GRAPHDB_POOL_SIZE: int = Field(default=50)
+    GRAPHDB_MAX_RETRY_TIME: float = Field(default=15.0)
 
     REDIS_HOST: str
     REDIS_PORT: int
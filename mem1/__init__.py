@@ -1,5 +1,7 @@
-from mem1.core import Mem1
+from mem1.core import DEFAULT_SESSION_ID, DEFAULT_USER_ID, Mem1
 
 __all__ = [
     Mem1,
+    DEFAULT_USER_ID,
+    DEFAULT_SESSION_ID,
 ]
@@ -1,6 +1,6 @@
 import asyncio
-from beanie import Document
 from copy import deepcopy
+from datetime import datetime, timezone
 import httpx
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -8,21 +8,31 @@ from neo4j import AsyncDriver
 from openai import AsyncOpenAI
 from qdrant_client import AsyncQdrantClient
 from textwrap import dedent
-from typing import List, Optional
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Set, Tuple
 
-from assistant.infra.database.schema import Message
-# TODO: Completely remove the MongoDB dependency for summary
-# of figure out a way to include this schema in the
-# already intialized MongoDB client.
-
-from .infra.database import DatabaseUtils
+from .infra.database import DatabaseUtils, SummaryConflictException
 from .infra.embedder import EmbedderUtils
-from .infra.graph_db import GraphDBUtils
+from .infra.embedding_backends import EmbeddingBackend, TEIEmbeddingBackend
+from .infra.embedding_cache import EmbeddingCache
+from .infra.entity_index import EntityIndexUtils
+from .infra.graph_db import COMMON_LABEL, GraphDBUtils
 
+from .infra.local_vectordb import LocalVectorDBUtils
 from .infra.vectordb import VectorDBUtils
-from .utils.enums import FactComparisonResult, NoFactStrings
+from .utils.cache import LRUCache
+from .utils.enums import (
+    EvictionPolicy,
+    FactComparisonResult,
+    MemoryInjectionMode,
+    MemoryRetrievalMode,
+    NoFactStrings,
+)
+from .utils.extraction_gate import FACT_EXEMPLARS, ExtractionGate
 from .utils.models import (
+    BatchFactsComparisonResultModel,
     CandidateFactsModel,
+    EntityResolutionBatch,
+    FactComparisonDecision,
     FactsComparisonResultModel,
     GraphTriplets,
     KnowledgeGraphExtraction,
@@ -33,12 +43,21 @@ from .utils.prompts import (
     SUMMARY_SYSTEM_PROMPT,
     CANDIDATE_FACT_PROMPT,
     COMPARE_OLD_AND_NEW_FACT_PROMPT,
+    COMPARE_FACTS_BATCH_PROMPT,
+    ENTITY_RESOLUTION_BATCH_PROMPT,
     GRAPH_EXTRACTION_PROMPT,
 )
+from .utils.text import extract_candidate_terms, normalize_name
+from .utils.tokens import trim_to_token_budget
+from .utils.write_queue import MemoryWriteQueue
 
 
 logger = logging.getLogger(__name__)
 
+NO_PREV_SUMMARY = "No previous history."
+DEFAULT_USER_ID = "default"
+DEFAULT_SESSION_ID = "default"
+
 
 class Mem1Exception(Exception):
     def __init__(
@@ -67,18 +86,57 @@ class Mem1:
         model_name: str,
         vector_db_client: AsyncQdrantClient,
         vector_db_collection: str,
-        embedder_client: httpx.AsyncClient,
-        database_client: AsyncIOMotorClient,  # NOTE: Will remove this once I figure out a more efficient way to store the summary.
-        database_collection: Document,
+        embedder_client: Optional[httpx.AsyncClient],
+        database_client: AsyncIOMotorClient,
+        database_name: str,
         graph_db_client: AsyncDriver,
         max_memories_in_vector_db: Optional[int] = 10,
         message_interval_for_summary: Optional[int] = 5,
         max_messages_for_new_fact: Optional[int] = 10,
+        fact_context_messages: Optional[int] = 2,
+        max_concurrent_facts: Optional[int] = 4,
+        candidate_dedupe_threshold: Optional[float] = 0.95,
+        batch_fact_comparison: Optional[bool] = True,
+        num_memory_workers: Optional[int] = 2,
+        read_your_writes_timeout: Optional[float] = 30.0,
+        memory_retrieval_mode: Optional[str] = MemoryRetrievalMode.TOP_K,
+        memory_top_k: Optional[int] = 20,
+        memory_token_budget: Optional[int] = 1000,
+        recency_weight: Optional[float] = 0.0,
+        recency_half_life_days: Optional[float] = 30.0,
+        memory_source_timeout: Optional[float] = 2.0,
+        graph_context_limit: Optional[int] = 20,
+        entity_cache_size: Optional[int] = 2048,
+        entity_cache_path: Optional[str] = None,
+        use_entity_index: Optional[bool] = True,
+        entity_collection: Optional[str] = None,
+        entity_match_threshold: Optional[float] = 0.92,
+        entity_candidate_threshold: Optional[float] = 0.6,
+        entity_candidates_limit: Optional[int] = 5,
+        embedding_model: Optional[str] = None,
+        embedding_cache_size: Optional[int] = 4096,
+        embedding_cache_path: Optional[str] = None,
+        embedding_cache_disk_size: Optional[int] = 100_000,
+        embed_coalesce_window: Optional[float] = None,
+        embed_coalesce_max_batch_size: Optional[int] = 32,
+        embedder_backend: Optional[EmbeddingBackend] = None,
+        local_vector_store_path: Optional[str] = None,
+        local_vector_store_dtype: Optional[str] = "float32",
+        local_vector_store_partitions: Optional[int] = 0,
+        eviction_policy: Optional[str] = EvictionPolicy.OLDEST,
+        access_stamp_batch_size: Optional[int] = 32,
+        fact_importance_fn: Optional[Callable[[str], float]] = None,
+        summary_collection: Optional[str] = "chat_summary",
+        summary_cache_size: Optional[int] = 1024,
+        memory_injection_mode: Optional[str] = MemoryInjectionMode.SYSTEM_PROMPT,
+        extraction_gate_threshold: Optional[float] = None,
+        extraction_gate_exemplars: Optional[List[str]] = FACT_EXEMPLARS,
+        extraction_gate_exemplar_threshold: Optional[float] = 0.5,
     ):
         self.chat_client = chat_client
         self.model_name = model_name
         self.database_client = database_client
-        self.database_collection = database_collection
+        self.database_name = database_name
         self.embedder_client = embedder_client
         self.vector_db_client = vector_db_client
         self.vector_db_collection = vector_db_collection
@@ -87,18 +145,112 @@ class Mem1:
         self.max_memories_in_vector_db = max_memories_in_vector_db
         self.message_interval_for_summary = message_interval_for_summary
         self.max_messages_for_new_fact = max_messages_for_new_fact
+        self.fact_context_messages = fact_context_messages
+        self.max_concurrent_facts = max(1, max_concurrent_facts or 1)
+        self.candidate_dedupe_threshold = candidate_dedupe_threshold
+        self.batch_fact_comparison = batch_fact_comparison
+        self.read_your_writes_timeout = read_your_writes_timeout
+        self.memory_retrieval_mode = MemoryRetrievalMode(memory_retrieval_mode)
+        self.memory_top_k = memory_top_k
+        self.memory_token_budget = memory_token_budget
+        self.recency_weight = recency_weight
+        self.recency_half_life_days = recency_half_life_days
+        self.memory_source_timeout = memory_source_timeout
+        self.memory_injection_mode = MemoryInjectionMode(memory_injection_mode)
+        self.graph_context_limit = graph_context_limit
+        self.use_entity_index = use_entity_index
+        self.entity_match_threshold = entity_match_threshold
+        self.entity_candidate_threshold = entity_candidate_threshold
+        self.entity_candidates_limit = entity_candidates_limit
+
+        self.eviction_policy = EvictionPolicy(eviction_policy)
+        self.access_stamp_batch_size = access_stamp_batch_size
+        self.fact_importance_fn = fact_importance_fn
+
+        # NOTE: Guard the capacity check + insert in `_add_fact` (one lock per user) so
+        # that facts added concurrently don't all see the same count and overshoot the limit.
+        self._vector_write_locks: Dict[str, asyncio.Lock] = {}
+        # Number of stored facts per user, read from the Vector DB once and then kept
+        # up to date by `_add_fact`, so the capacity check doesn't need to scan the store.
+        self._fact_counts: Dict[str, int] = {}
+        # Ids of retrieved facts whose `last_accessed` stamp is not written yet.
+        self._pending_access_ids: Set = set()
+        self._access_flush_tasks: Set[asyncio.Task] = set()
+        # Prompt tokens of Mem1's own LLM calls, and how many of them were served
+        # from the provider's prefix cache.
+        self._prompt_tokens = 0
+        self._cached_prompt_tokens = 0
 
         self.db_utils = DatabaseUtils(
             db_client=self.database_client,
-            collection=self.database_collection,
+            database_name=self.database_name,
+            collection_name=summary_collection,
+            cache_size=summary_cache_size,
         )
-        self.embedder = EmbedderUtils(embedder_client=self.embedder_client)
-        self.graphdb_utils = GraphDBUtils(driver=self.graph_db_client)
-        self.vectordb_utils = VectorDBUtils(
+        # NOTE: `embedder_client` (TEI over HTTP) is only used when no in-process
+        # `embedder_backend` is given.
+        if embedder_backend is None:
+            embedder_backend = TEIEmbeddingBackend(
+                client=self.embedder_client, model_name=embedding_model or "default"
+            )
+        self.embedding_cache = None
+        if embedding_cache_size:
+            # NOTE: Keyed on the backend's model id, not on `embedding_model`, which
+            # is only the label given to the TEI backend.
+            self.embedding_cache = EmbeddingCache(
+                max_entries=embedding_cache_size,
+                disk_path=embedding_cache_path,
+                disk_max_entries=embedding_cache_disk_size,
+            )
+        self.embedder = EmbedderUtils(
+            backend=embedder_backend,
+            cache=self.embedding_cache,
+            coalesce_window=embed_coalesce_window,
+            coalesce_max_batch_size=embed_coalesce_max_batch_size,
+        )
+        self.entity_index = EntityIndexUtils(
             vectordb_client=self.vector_db_client,
-            vectordb_collection=self.vector_db_collection,
+            collection_name=entity_collection
+            or f"{self.vector_db_collection}_entities",
             embedder=self.embedder,
         )
+        self.graphdb_utils = GraphDBUtils(
+            driver=self.graph_db_client, entity_index=self.entity_index
+        )
+        self.entity_cache = LRUCache(
+            max_size=entity_cache_size,
+            persist_path=entity_cache_path,
+        )
+        self.graphdb_utils.add_node_change_listener(self.invalidate_entity_cache)
+        # NOTE: Facts go to an in-process vector store instead of Qdrant when a
+        # `local_vector_store_path` is given. The entity index still uses Qdrant.
+        if local_vector_store_path:
+            self.vectordb_utils = LocalVectorDBUtils(
+                path=local_vector_store_path,
+                embedder=self.embedder,
+                dtype=local_vector_store_dtype,
+                num_partitions=local_vector_store_partitions,
+            )
+        else:
+            self.vectordb_utils = VectorDBUtils(
+                vectordb_client=self.vector_db_client,
+                vectordb_collection=self.vector_db_collection,
+                embedder=self.embedder,
+            )
+        # NOTE: The gate is off unless a threshold is given. Then turns that score below
+        # it (and aren't close to any exemplar) skip the candidate-fact LLM call.
+        self.extraction_gate = None
+        if extraction_gate_threshold is not None:
+            self.extraction_gate = ExtractionGate(
+                threshold=extraction_gate_threshold,
+                embedder=self.embedder,
+                exemplars=extraction_gate_exemplars,
+                exemplar_threshold=extraction_gate_exemplar_threshold,
+            )
+        self.write_queue = MemoryWriteQueue(
+            process_fn=self.process_memory,
+            num_workers=num_memory_workers,
+        )
 
     async def _summarize_messages(
         self, messages: List[Message], prev_summary: Optional[str] = None
@@ -106,7 +258,6 @@ class Mem1:
         try:
             logger.info(f"Summarize messages called!")
             msgs = deepcopy(messages)
-            msgs = msgs[-(self.max_messages_for_new_fact) :]
             summary_prompt = SUMMARY_SYSTEM_PROMPT
             sys_msg = Message(
                 role="system",
@@ -121,8 +272,12 @@ class Mem1:
 
             response = await self.chat_client.chat.completions.create(
                 model=self.model_name,
-                messages=[final_msg.model_dump() for final_msg in final_msgs],
+                messages=[
+                    final_msg.model_dump(include={"role", "content"})
+                    for final_msg in final_msgs
+                ],
             )
+            self._record_usage(response)
 
             return response.choices[0].message.content
 
@@ -140,10 +295,20 @@ class Mem1:
 
         return usr_msg_count
 
-    def _form_user_msg_for_candidate_fact(self, messages: List[Message], summary: str):
+    def _form_user_msg_for_candidate_fact(
+        self,
+        messages: List[Message],
+        summary: str,
+        context_messages: Optional[List[Message]] = None,
+    ):
         logger.info("_form_user_msg_for_candidate_fact called")
         user_msg = []
+        user_msg.append(f"CURRENT TIME: {datetime.now().strftime('%Y-%m-%d')}\n")
         user_msg.append(f"CONTEXTUAL SUMMARY:\n{summary}\n")
+        if context_messages:
+            user_msg.append(f"\nEARLIER MESSAGES (already processed):\n")
+            for msg in context_messages:
+                user_msg.append(f"{msg.role.upper()}: {msg.content}")
         user_msg.append(f"\nRECENT MESSAGES:\n")
         for msg in messages:
             user_msg.append(f"{msg.role.upper()}: {msg.content}")
@@ -154,8 +319,13 @@ class Mem1:
         return final_user_msg
 
     async def _find_candidate_facts(
-        self, messages: List[Message], summary: str
+        self,
+        messages: List[Message],
+        summary: str,
+        context_messages: Optional[List[Message]] = None,
     ) -> List:
+        # Facts are only extracted from `messages`. `context_messages` are the ones
+        # right before them, sent only to resolve references.
         logger.info("_find_candidate_facts called")
         try:
             msgs = messages[-(self.max_messages_for_new_fact) :]
@@ -163,15 +333,20 @@ class Mem1:
                 role="system",
                 content=CANDIDATE_FACT_PROMPT,
             )
-            query_msg = self._form_user_msg_for_candidate_fact(msgs, summary)
+            query_msg = self._form_user_msg_for_candidate_fact(
+                msgs, summary, context_messages
+            )
             msgs_raw = [sys_msg, query_msg]
-            msgs_to_send = [msg_raw.model_dump() for msg_raw in msgs_raw]
+            msgs_to_send = [
+                msg_raw.model_dump(include={"role", "content"}) for msg_raw in msgs_raw
+            ]
 
             response = await self.chat_client.beta.chat.completions.parse(
                 model=self.model_name,
                 messages=msgs_to_send,
                 response_format=CandidateFactsModel,
             )
+            self._record_usage(response)
             result = response.choices[0].message.parsed
             logger.info(f"candidate facts: {result.facts}")
             logger.info(f"LLM Reasoning: {result.reasoning}")
@@ -184,64 +359,155 @@ class Mem1:
                 error=str(e),
             )
 
+    def _compare_facts_without_llm(
+        self, old_fact: str, new_fact: str
+    ) -> Optional[FactsComparisonResultModel]:
+        NO_FACT_STR = [res.value for res in NoFactStrings]
+
+        if old_fact in NO_FACT_STR and new_fact in NO_FACT_STR:
+            return FactsComparisonResultModel(
+                result=FactComparisonResult.NONE,
+                fact="",
+            )
+        elif old_fact in NO_FACT_STR:
+            return FactsComparisonResultModel(
+                result=FactComparisonResult.ADD,
+                fact=new_fact,
+            )
+        elif new_fact in NO_FACT_STR:
+            return FactsComparisonResultModel(
+                result=FactComparisonResult.NONE,
+                fact="",
+            )
+        return None
+
     async def _compare_facts(self, old_fact: str, new_fact: str):
         logger.info("_compare_facts called")
         try:
-            NO_FACT_STR = [res.value for res in NoFactStrings]
+            res = self._compare_facts_without_llm(old_fact, new_fact)
+            if res is not None:
+                return res
 
-            if old_fact in NO_FACT_STR and new_fact in NO_FACT_STR:
-                return FactsComparisonResultModel(
-                    result=FactComparisonResult.NONE,
-                    fact="",
-                )
-            elif old_fact in NO_FACT_STR:
-                return FactsComparisonResultModel(
-                    result=FactComparisonResult.ADD,
-                    fact=new_fact,
-                )
-            elif new_fact in NO_FACT_STR:
-                return FactsComparisonResultModel(
-                    result=FactComparisonResult.NONE,
-                    fact="",
-                )
-            else:
-                sys_msg = Message(
-                    role="system",
-                    content=COMPARE_OLD_AND_NEW_FACT_PROMPT,
-                )
-                usr_msg_content = (
-                    f"\nOLD FACT:\n{old_fact}\n\nNEW CANDIDATE FACT:\n{new_fact}"
-                )
-                logger.debug(f"msg for comparing facts: {usr_msg_content}")
-                user_msg = Message(
-                    role="user",
-                    content=usr_msg_content,
+            sys_msg = Message(
+                role="system",
+                content=COMPARE_OLD_AND_NEW_FACT_PROMPT,
+            )
+            usr_msg_content = (
+                f"\nOLD FACT:\n{old_fact}\n\nNEW CANDIDATE FACT:\n{new_fact}"
+            )
+            logger.debug(f"msg for comparing facts: {usr_msg_content}")
+            user_msg = Message(
+                role="user",
+                content=usr_msg_content,
+            )
+            msgs = [sys_msg, user_msg]
+            response = await self.chat_client.beta.chat.completions.parse(
+                model=self.model_name,
+                messages=msgs,
+                response_format=FactsComparisonResultModel,
+            )
+            self._record_usage(response)
+            res = response.choices[0].message.parsed
+            logging.debug(f"facts comparison results: {res}")
+            return res
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while comparing facts.",
+                error=str(e),
+            )
+
+    def _is_valid_decision(self, decision: FactComparisonDecision) -> bool:
+        if decision.result not in [res.value for res in FactComparisonResult]:
+            return False
+        if decision.result != FactComparisonResult.NONE.value:
+            return bool(decision.fact.strip())
+        return True
+
+    async def _compare_facts_batch(
+        self, pairs: List[Tuple[str, str]]
+    ) -> List[FactsComparisonResultModel]:
+        # Settles every (old fact, new fact) pair with a single LLM call. Pairs that
+        # don't need the LLM are resolved locally, and pairs the LLM skipped or
+        # answered with a malformed decision fall back to `_compare_facts`.
+        logger.info("_compare_facts_batch called")
+        results = [self._compare_facts_without_llm(old, new) for old, new in pairs]
+        pending = [i for i, res in enumerate(results) if res is None]
+
+        if len(pending) > 1:
+            try:
+                pairs_str = "\n\n".join(
+                    f"PAIR {i}:\nOLD FACT:\n{pairs[i][0]}\nNEW CANDIDATE FACT:\n{pairs[i][1]}"
+                    for i in pending
                 )
-                msgs = [sys_msg, user_msg]
+                logger.debug(f"msg for comparing facts in batch: {pairs_str}")
+                msgs = [
+                    Message(role="system", content=COMPARE_FACTS_BATCH_PROMPT),
+                    Message(role="user", content=pairs_str),
+                ]
                 response = await self.chat_client.beta.chat.completions.parse(
                     model=self.model_name,
                     messages=msgs,
-                    response_format=FactsComparisonResultModel,
+                    response_format=BatchFactsComparisonResultModel,
                 )
-                res = response.choices[0].message.parsed
-                logging.debug(f"facts comparison results: {res}")
-                return res
+                self._record_usage(response)
+                decisions = response.choices[0].message.parsed.decisions
+                logger.debug(f"batch facts comparison results: {decisions}")
 
-        except Exception as e:
-            raise Mem1Exception(
-                message="Error while comparing facts.",
-                error=str(e),
+                for decision in decisions:
+                    if decision.pair_id not in pending:
+                        continue
+                    if results[decision.pair_id] is not None:
+                        continue
+                    if not self._is_valid_decision(decision):
+                        logger.warning(f"Malformed comparison decision: {decision}")
+                        continue
+                    results[decision.pair_id] = FactsComparisonResultModel(
+                        result=decision.result,
+                        fact=decision.fact,
+                    )
+
+            except Exception as e:
+                logger.error(f"Batch fact comparison failed: {str(e)}")
+
+        fallback = [i for i in pending if results[i] is None]
+        if fallback:
+            logger.info(
+                f"Falling back to per-pair comparison for {len(fallback)} pairs."
             )
+            fallback_results = await self._run_bounded(
+                [self._compare_facts(*pairs[i]) for i in fallback]
+            )
+            for i, res in zip(fallback, fallback_results):
+                results[i] = res
+
+        return results
+
+    def _get_fact_importance(self, fact: str) -> Optional[float]:
+        # None lets the vector store fall back to `DEFAULT_IMPORTANCE`.
+        if self.fact_importance_fn is None:
+            return None
+        return self.fact_importance_fn(fact)
 
-    async def _add_fact(self, fact: str):
+    async def _add_fact(self, fact: str, user_id: str, session_id: str):
         logger.info("_add_fact called")
         try:
-            all_facts = await self.vectordb_utils.retrieve_all_points()
-            if all_facts is not None:
-                if len(all_facts) > self.max_memories_in_vector_db:
-                    await self.vectordb_utils.find_oldest_fact_and_delete()
+            lock = self._vector_write_locks.setdefault(user_id, asyncio.Lock())
+            async with lock:
+                if user_id not in self._fact_counts:
+                    self._fact_counts[user_id] = await self.vectordb_utils.count_points(
+                        user_id
+                    )
+                if self._fact_counts[user_id] >= self.max_memories_in_vector_db:
+                    await self._evict_fact(user_id)
 
-            await self.vectordb_utils.store_point(fact)
+                await self.vectordb_utils.store_point(
+                    fact,
+                    user_id,
+                    session_id=session_id,
+                    importance=self._get_fact_importance(fact),
+                )
+                self._fact_counts[user_id] += 1
 
         except Exception as e:
             raise Mem1Exception(
@@ -249,11 +515,77 @@ class Mem1:
                 error=str(e),
             )
 
-    async def _update_fact(self, new_fact: str, old_fact):
+    async def _evict_fact(self, user_id: str):
+        order_key = {
+            EvictionPolicy.OLDEST: "timestamp",
+            EvictionPolicy.LEAST_RECENTLY_USED: "last_accessed",
+            EvictionPolicy.LOWEST_IMPORTANCE: "importance",
+        }[self.eviction_policy]
+        if self.eviction_policy == EvictionPolicy.LEAST_RECENTLY_USED:
+            await self._flush_access_stamps()
+
+        evicted_id = await self.vectordb_utils.evict_point(user_id, order_key=order_key)
+        if evicted_id is None and order_key != "timestamp":
+            # Facts stored by older versions don't have the newer payload fields.
+            evicted_id = await self.vectordb_utils.evict_point(
+                user_id, order_key="timestamp"
+            )
+
+        if evicted_id is not None:
+            self._fact_counts[user_id] -= 1
+            self._pending_access_ids.discard(evicted_id)
+            logger.info(f"Evicted fact {evicted_id} ({self.eviction_policy}).")
+
+    def _record_access(self, points: List):
+        # Access stamps are buffered and written in batches, off the read path.
+        if self.eviction_policy != EvictionPolicy.LEAST_RECENTLY_USED:
+            return
+
+        self._pending_access_ids.update(point.id for point in points)
+        if len(self._pending_access_ids) >= self.access_stamp_batch_size:
+            task = asyncio.create_task(self._flush_access_stamps())
+            self._access_flush_tasks.add(task)
+            task.add_done_callback(self._access_flush_tasks.discard)
+
+    async def _flush_access_stamps(self):
+        point_ids, self._pending_access_ids = self._pending_access_ids, set()
+        if not point_ids:
+            return
+
+        try:
+            await self.vectordb_utils.touch_points(
+                list(point_ids), int(datetime.now().timestamp())
+            )
+
+        except Exception as e:
+            logger.error(f"Error while writing access stamps: {str(e)}")
+
+    async def _update_fact(
+        self, new_fact: str, old_fact, user_id: str, session_id: str
+    ):
         logger.info("_update_fact called")
         try:
-            await self.vectordb_utils.delete_point(old_fact)
-            await self.vectordb_utils.store_point(new_fact)
+            lock = self._vector_write_locks.setdefault(user_id, asyncio.Lock())
+            async with lock:
+                if user_id not in self._fact_counts:
+                    self._fact_counts[user_id] = await self.vectordb_utils.count_points(
+                        user_id
+                    )
+
+                self._pending_access_ids.discard(old_fact.id)
+                if await self.vectordb_utils.delete_point(old_fact):
+                    self._fact_counts[user_id] -= 1
+                elif self._fact_counts[user_id] >= self.max_memories_in_vector_db:
+                    # The old fact was already evicted, so this is a new fact.
+                    await self._evict_fact(user_id)
+
+                await self.vectordb_utils.store_point(
+                    new_fact,
+                    user_id,
+                    session_id=session_id,
+                    importance=self._get_fact_importance(new_fact),
+                )
+                self._fact_counts[user_id] += 1
 
         except Exception as e:
             raise Mem1Exception(
@@ -261,35 +593,214 @@ class Mem1:
                 error=str(e),
             )
 
-    async def _resolve_entity(self, extracted_name: str, entity_type: str) -> str:
-        logger.info("_resolve_entity called")
-        if await self.graphdb_utils.find_node_by_name(extracted_name):
-            return extracted_name
+    def _get_entity_cache_key(
+        self, name: str, entity_type: str, user_id: str
+    ) -> Tuple[str, str, str]:
+        return (user_id, normalize_name(name), entity_type)
 
-        candidates = await self.graphdb_utils.search_similar_nodes(extracted_name)
-        if not candidates:
-            return extracted_name
+    def _cache_entity_resolution(
+        self, extracted_name: str, entity_type: str, resolved_name: str, user_id: str
+    ) -> str:
+        # NOTE: "NEW" decisions are cached too, as the extracted name itself. Later
+        # mentions (in any casing) then map to the node that got created for it.
+        self.entity_cache.set(
+            self._get_entity_cache_key(extracted_name, entity_type, user_id),
+            resolved_name,
+        )
+        return resolved_name
 
-        candidate_names = [c["name"] for c in candidates]
+    def invalidate_entity_cache(
+        self, name: Optional[str] = None, user_id: Optional[str] = None
+    ):
+        # Drops cached resolutions that involve `name` (either as input or as the
+        # resolved node) of `user_id`, or of every user when `user_id` is None.
+        # Without a `name`, all the entries of the user (or the whole cache) go.
+        # GraphDBUtils calls this on its own deletes and migrations. Anything that
+        # merges or renames nodes directly in the graph has to call it as well.
+        if name is None and user_id is None:
+            self.entity_cache.clear()
+            return
 
-        try:
-            prompt = dedent(f"""
-            Resolve Entity.
-            Input: "{extracted_name}" ({entity_type}).
-            Existing Options: {candidate_names}.
-            Does Input refer to an option? Return EXACT option name or "NEW".
-            """)
-            response = await self.chat_client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
+        normalized = normalize_name(name) if name is not None else None
+        removed = self.entity_cache.invalidate_where(
+            lambda key, value: (
+                (user_id is None or key[0] == user_id)
+                and (
+                    normalized is None
+                    or key[1] == normalized
+                    or normalize_name(value) == normalized
+                )
             )
-            decision = response.choices[0].message.content.strip()
-            return decision if decision in candidate_names else extracted_name
+        )
+        logger.debug(
+            f"Invalidated {removed} entity cache entries for {name or 'all nodes'}."
+        )
 
-        except Exception as e:
-            logger.error(f"Exception while resolving entity: {str(e)}")
-            return extracted_name
+    async def _resolve_entities_with_llm(
+        self, pending: List[Tuple[str, str, List[str]]]
+    ) -> Dict[int, str]:
+        # One structured LLM call for all the entities that have fuzzy candidates.
+        # Returns the resolved name for every entity the LLM answered for properly.
+        entities_str = "\n\n".join(
+            f'ENTITY {i}: "{name}" ({entity_type})\nExisting Options: {candidates}'
+            for i, (name, entity_type, candidates) in enumerate(pending)
+        )
+        msgs = [
+            Message(role="system", content=ENTITY_RESOLUTION_BATCH_PROMPT),
+            Message(role="user", content=entities_str),
+        ]
+        response = await self.chat_client.beta.chat.completions.parse(
+            model=self.model_name,
+            messages=msgs,
+            response_format=EntityResolutionBatch,
+            temperature=0,
+        )
+        self._record_usage(response)
+        resolutions = response.choices[0].message.parsed.resolutions
+        logger.debug(f"entity resolutions: {resolutions}")
+
+        resolved = {}
+        for item in resolutions:
+            if not 0 <= item.entity_id < len(pending) or item.entity_id in resolved:
+                continue
+            extracted_name, _, candidates = pending[item.entity_id]
+            decision = item.resolved_name.strip()
+            resolved[item.entity_id] = (
+                decision if decision in candidates else extracted_name
+            )
+
+        return resolved
+
+    async def _lookup_entities_in_index(
+        self, entities: List[Tuple[str, str]], user_id: str
+    ) -> Tuple[Dict[Tuple[str, str], Tuple[Optional[str], List[str]]], Dict]:
+        # For every entity: the node it confidently matches (if any) and the
+        # candidates the LLM should pick from otherwise. Also returns the embeddings.
+        vectors, results = await self.entity_index.search_entities(
+            entities, user_id, limit=self.entity_candidates_limit
+        )
+        lookups = {}
+        for (name, entity_type), points in zip(entities, results):
+            normalized = normalize_name(name)
+            names = [point.payload.get("name") for point in points]
+            exact = next((n for n in names if normalize_name(n) == normalized), None)
+            # Similar enough to be the same node, so the LLM step can be skipped.
+            confident = next(
+                (
+                    point.payload.get("name")
+                    for point in points
+                    if point.score >= self.entity_match_threshold
+                ),
+                None,
+            )
+            candidates = [
+                point.payload.get("name")
+                for point in points
+                if point.score >= self.entity_candidate_threshold
+            ]
+            lookups[(name, entity_type)] = (exact or confident, candidates)
+
+        return lookups, dict(zip(entities, vectors))
+
+    async def _lookup_entities_in_graph(
+        self, entities: List[Tuple[str, str]], user_id: str
+    ) -> Dict[Tuple[str, str], Tuple[Optional[str], List[str]]]:
+        records = await self.graphdb_utils.find_resolution_candidates(
+            list(dict.fromkeys(name for name, _ in entities)), user_id
+        )
+        records_by_name = {rec["input"]: rec for rec in records}
+
+        lookups = {}
+        for name, entity_type in entities:
+            rec = records_by_name.get(name)
+            if rec is None:
+                continue
+            match = name if rec["exact_match"] else None
+            lookups[(name, entity_type)] = (match, rec["candidates"])
+
+        return lookups
+
+    async def _resolve_entities(
+        self, entities: List[Tuple[str, str]], user_id: str
+    ) -> Tuple[Dict[Tuple[str, str], str], Dict[Tuple[str, str], List[float]]]:
+        # Resolves every (name, entity type) pair against the user's own nodes, with
+        # at most one lookup and one LLM call.
+        # Returns the resolved node name for every input pair, and the embeddings of the
+        # entities that turned out to be new nodes (so that they can be indexed).
+        logger.info("_resolve_entities called")
+        resolved = {}
+        to_lookup = []
+        for name, entity_type in dict.fromkeys(entities):
+            cached = self.entity_cache.get(
+                self._get_entity_cache_key(name, entity_type, user_id)
+            )
+            if cached is not None:
+                resolved[(name, entity_type)] = cached
+            else:
+                to_lookup.append((name, entity_type))
+
+        if not to_lookup:
+            return resolved, {}
+
+        lookups = None
+        vectors = {}
+        if self.use_entity_index:
+            try:
+                lookups, vectors = await self._lookup_entities_in_index(
+                    to_lookup, user_id
+                )
+            except Exception as e:
+                logger.error(
+                    f"Entity index lookup failed, falling back to GraphDB: {str(e)}"
+                )
+        if lookups is None:
+            lookups = await self._lookup_entities_in_graph(to_lookup, user_id)
+
+        pending = []
+        for name, entity_type in to_lookup:
+            if (name, entity_type) not in lookups:
+                # NOTE: The lookup failed for this name. Don't cache anything for it.
+                resolved[(name, entity_type)] = name
+                continue
+
+            match, candidates = lookups[(name, entity_type)]
+            if match is not None or not candidates:
+                resolved[(name, entity_type)] = self._cache_entity_resolution(
+                    name, entity_type, match or name, user_id
+                )
+            else:
+                pending.append((name, entity_type, candidates))
+
+        if pending:
+            try:
+                llm_resolved = await self._resolve_entities_with_llm(pending)
+            except Exception as e:
+                logger.error(f"Exception while resolving entities: {str(e)}")
+                llm_resolved = {}
+
+            for i, (name, entity_type, _) in enumerate(pending):
+                if i in llm_resolved:
+                    resolved[(name, entity_type)] = self._cache_entity_resolution(
+                        name, entity_type, llm_resolved[i], user_id
+                    )
+                else:
+                    resolved[(name, entity_type)] = name
+
+        new_entities = {
+            key: vector
+            for key, vector in vectors.items()
+            if lookups.get(key, (None, []))[0] is None and resolved[key] == key[0]
+        }
+        return resolved, new_entities
+
+    async def _resolve_entity(
+        self, extracted_name: str, entity_type: str, user_id: str
+    ) -> str:
+        logger.info("_resolve_entity called")
+        resolved, _ = await self._resolve_entities(
+            [(extracted_name, entity_type)], user_id
+        )
+        return resolved[(extracted_name, entity_type)]
 
     async def _extract_knowledge_graph(self, fact: str) -> List[GraphTriplets]:
         logger.info("_extract_knowledge_graph called")
@@ -302,156 +813,713 @@ class Mem1:
                 messages=[sys_msg, user_msg],
                 response_format=KnowledgeGraphExtraction,
             )
+            self._record_usage(response)
             return response.choices[0].message.parsed.triplets
 
         except Exception as e:
             logger.error(f"Error extracting graph data: {str(e)}")
             return []
 
-    async def _update_graph_memory(self, fact: str):
+    async def _update_graph_memory(self, fact: str, user_id: str):
         logger.info("_update_graph_memory called")
         triplets = await self._extract_knowledge_graph(fact)
-        for t in triplets:
-            subj_name = await self._resolve_entity(t.subject, t.subject_type)
-            obj_name = await self._resolve_entity(t.object, t.object_type)
-
-            await self.graphdb_utils.add_node(
-                parameters={"name": subj_name},
-                entity=t.subject_type,
-            )
-            await self.graphdb_utils.add_node(
-                parameters={"name": obj_name},
-                entity=t.object_type,
+        resolved, new_entities = await self._resolve_entities(
+            [(t.subject, t.subject_type) for t in triplets]
+            + [(t.object, t.object_type) for t in triplets],
+            user_id,
+        )
+        resolved_triplets = [
+            GraphTriplets(
+                subject=resolved[(t.subject, t.subject_type)],
+                predicate=t.predicate,
+                object=resolved[(t.object, t.object_type)],
+                subject_type=t.subject_type,
+                object_type=t.object_type,
             )
-            await self.graphdb_utils.add_relationship(
-                node_1_name=subj_name,
-                node_2_name=obj_name,
-                relationship=t.predicate,
-                node_1_entity=t.subject_type,
-                node_2_entity=t.object_type,
+            for t in triplets
+        ]
+        await self.graphdb_utils.upsert_triplets(
+            resolved_triplets, user_id, node_embeddings=new_entities
+        )
+        logger.info(f"Updated GraphDB with {len(triplets)} relationships.")
+
+        if new_entities:
+            try:
+                await self.entity_index.add_entities(
+                    list(new_entities.keys()), user_id, list(new_entities.values())
+                )
+            except Exception as e:
+                logger.error(f"Error while indexing new entities: {str(e)}")
+
+    async def reindex_entities(self, batch_size: int = 256):
+        # Adds every existing graph node to the entity index. Only needed once for
+        # graphs that were built before the entity index existed.
+        try:
+            skip = 0
+            while True:
+                nodes = await self.graphdb_utils.get_nodes(skip=skip, limit=batch_size)
+                if not nodes:
+                    break
+
+                entities_by_user: Dict[str, List[Tuple[str, str]]] = {}
+                for node in nodes:
+                    if not node["name"]:
+                        continue
+                    entities_by_user.setdefault(
+                        node.get("user_id") or DEFAULT_USER_ID, []
+                    ).append(
+                        (
+                            node["name"],
+                            node["labels"][0] if node["labels"] else COMMON_LABEL,
+                        )
+                    )
+                for user_id, entities in entities_by_user.items():
+                    await self.entity_index.add_entities(entities, user_id)
+                skip += batch_size
+
+            logger.info(f"Reindexed {skip} graph nodes into the entity index.")
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while reindexing graph entities.",
+                error=str(e),
             )
-            logger.info(f"Updated GraphDB with {len(triplets)} relationships.")
 
-    async def _retrieve_graph_context(self, user_query: str) -> str:
+    async def _retrieve_graph_context(self, user_query: str, user_id: str) -> str:
         logger.info("_retrieve_graph_context called")
-        keywords = user_query.split()
+        terms = extract_candidate_terms(user_query)
+        if not terms:
+            return ""
+
+        data = await self.graphdb_utils.get_neighborhoods(
+            terms,
+            user_id,
+            per_term_limit=5,
+            limit=self.graph_context_limit * 2,
+        )
+
+        # Multi-word terms are more specific than single words, and direct
+        # relationships are more relevant than 2-hop ones, so they go first.
+        ranked = sorted(
+            data,
+            key=lambda rec: (len(rec["term"].split()), rec["target"] is None),
+            reverse=True,
+        )
         context_lines = []
+        for rec in ranked:
+            line = f"{rec['source']} {rec['rel1']} {rec['intermediate']}"
+            if rec["target"]:
+                line += f" which {rec['rel2']} {rec['target']}"
+            context_lines.append(line)
 
-        for word in keywords:
-            if len(word) > 3:
-                data = await self.graphdb_utils.get_2_hop_neighborhood(word, limit=5)
-                for rec in data:
-                    line = f"{rec['source']} {rec['rel1']} {rec['intermediate']}"
-                    if rec["target"]:
-                        line += f" which {rec['rel2']} {rec['target']}"
-                    context_lines.append(line)
+        context_lines = list(dict.fromkeys(context_lines))
+        return "\n".join(context_lines[: self.graph_context_limit])
 
-        return "\n".join(set(context_lines))
+    async def _run_bounded(self, coros: List[Coroutine]) -> List:
+        semaphore = asyncio.Semaphore(self.max_concurrent_facts)
 
-    async def process_memory(self, messages: List[Message]):
-        try:
-            user_msg_count = self._count_user_messages(messages)
-            # if (user_msg_count) % self.max_messages_for_new_fact == 0:  # type: ignore
-            #     return messages
+        async def _run(coro: Coroutine):
+            async with semaphore:
+                return await coro
 
-            current_summary_text = await self.db_utils.get_chat_summary()
-            if not current_summary_text:
-                current_summary_text = "No previous history."
+        return await asyncio.gather(*[_run(coro) for coro in coros])
 
-            candidate_facts = await self._find_candidate_facts(
-                messages, current_summary_text
-            )
+    def _group_facts_by_point(self, candidate_facts: List[str], old_fact_points: List):
+        # Facts that matched the same existing memory point end up in the same group,
+        # so that they are applied one after another. Facts without a match are independent.
+        groups = {}
+        for i, (candidate_fact, old_fact_point) in enumerate(
+            zip(candidate_facts, old_fact_points)
+        ):
+            key = old_fact_point.id if old_fact_point is not None else f"new-{i}"
+            groups.setdefault(key, []).append((candidate_fact, old_fact_point))
+
+        return list(groups.values())
+
+    def _get_old_fact(self, old_fact_point) -> str:
+        if old_fact_point is not None:
+            logger.debug(f"old_fact_point: {old_fact_point}")
+            return old_fact_point.payload.get("text")
+        return NoFactStrings.NO_PREV_FACT.value
+
+    async def _apply_candidate_fact(
+        self,
+        candidate_fact: str,
+        old_fact_point,
+        user_id: str,
+        session_id: str,
+        fact_comp_res: Optional[FactsComparisonResultModel] = None,
+    ) -> bool:
+        if fact_comp_res is None:
+            old_fact = self._get_old_fact(old_fact_point)
+            fact_comp_res = await self._compare_facts(old_fact, candidate_fact)
+        comparison_res = fact_comp_res.result.strip()
+        comparison_fact = fact_comp_res.fact.strip()
+
+        match comparison_res:
+            case FactComparisonResult.ADD.value:
+                logger.info("ADDING NEW FACT")
+                await self._add_fact(comparison_fact, user_id, session_id)
+                await self._update_graph_memory(comparison_fact, user_id)
+                return True
 
-            for candidate_fact in candidate_facts:
-                old_fact_point = (
-                    await self.vectordb_utils.retrieve_point(text=candidate_fact)
-                    or NoFactStrings.NO_PREV_FACT.value
+            case FactComparisonResult.UPDATE.value:
+                logger.info("UPDATING EXISTING FACT")
+                await self._update_fact(
+                    comparison_fact, old_fact_point, user_id, session_id
                 )
-                if not isinstance(old_fact_point, str):
-                    logger.debug(f"old_fact_point: {old_fact_point}")
-                    old_fact = old_fact_point.payload.get("text")
-                else:
-                    old_fact = NoFactStrings.NO_PREV_FACT.value
-
-                fact_comp_res = await self._compare_facts(old_fact, candidate_fact)
-                comparison_res = fact_comp_res.result.strip()
-                comparison_fact = fact_comp_res.fact.strip()
-
-                match comparison_res:
-                    case FactComparisonResult.ADD.value:
-                        logger.info("ADDING NEW FACT")
-                        await self._add_fact(comparison_fact)
-                        await self._update_graph_memory(comparison_fact)
-
-                    case FactComparisonResult.UPDATE.value:
-                        logger.info("UPDATING EXISTING FACT")
-                        await self._update_fact(comparison_fact, old_fact_point)
-                        await self._update_graph_memory(comparison_fact)
-
-                    case FactComparisonResult.NONE.value:
-                        logger.info("NO CHANGES TO FACTS")
-                        pass
-
-                    case _:
-                        raise Mem1Exception(
-                            message="Error in LLM output while checking comparison results",
-                            error=f"The LLM returned {fact_comp_res.strip()} which does not match any of `ADD`, `UPDATE` or `NONE`.",
-                            suggestion="This is a LLM side error. Alter prompt for better results.",
-                        )
+                await self._update_graph_memory(comparison_fact, user_id)
+                return True
+
+            case FactComparisonResult.NONE.value:
+                logger.info("NO CHANGES TO FACTS")
+                return False
+
+            case _:
+                raise Mem1Exception(
+                    message="Error in LLM output while checking comparison results",
+                    error=f"The LLM returned {fact_comp_res.result} which does not match any of `ADD`, `UPDATE` or `NONE`.",
+                    suggestion="This is a LLM side error. Alter prompt for better results.",
+                )
+
+    async def _process_fact_group(
+        self,
+        group: List[Tuple[str, Any]],
+        user_id: str,
+        session_id: str,
+        first_comparison: Optional[FactsComparisonResultModel] = None,
+    ):
+        has_written = False
+        for i, (candidate_fact, old_fact_point) in enumerate(group):
+            if has_written:
+                # An earlier fact in this group already changed the point it matched,
+                # so look the neighbour up again instead of comparing against stale data.
+                old_fact_point = await self.vectordb_utils.retrieve_point(
+                    text=candidate_fact, user_id=user_id
+                )
+            has_written = (
+                await self._apply_candidate_fact(
+                    candidate_fact,
+                    old_fact_point,
+                    user_id,
+                    session_id,
+                    first_comparison if i == 0 else None,
+                )
+                or has_written
+            )
+
+    async def _process_candidate_facts(
+        self, candidate_facts: List[str], user_id: str, session_id: str
+    ):
+        logger.info("_process_candidate_facts called")
+        candidate_facts, old_fact_points = await self.vectordb_utils.retrieve_points(
+            texts=candidate_facts,
+            user_id=user_id,
+            dedupe_threshold=self.candidate_dedupe_threshold,
+        )
+        groups = self._group_facts_by_point(candidate_facts, old_fact_points)
+        logger.info(
+            f"Processing {len(candidate_facts)} candidate facts in {len(groups)} groups."
+        )
+
+        # NOTE: Only the first fact of each group is compared in the batch. The later ones
+        # depend on what the earlier facts of their group wrote, so they are compared one by one.
+        first_comparisons = [None] * len(groups)
+        if self.batch_fact_comparison:
+            first_comparisons = await self._compare_facts_batch(
+                [(self._get_old_fact(group[0][1]), group[0][0]) for group in groups]
+            )
 
-            is_interval_hit = (user_msg_count) % self.message_interval_for_summary == 0  # type: ignore
-            should_update = (
-                current_summary_text == "No Previous History"
-            ) or is_interval_hit
+        await self._run_bounded(
+            [
+                self._process_fact_group(group, user_id, session_id, first_comparison)
+                for group, first_comparison in zip(groups, first_comparisons)
+            ]
+        )
+
+    async def _update_summary(
+        self,
+        messages: List[Message],
+        current_summary_text: str,
+        is_interval_hit: bool,
+        user_id: str,
+        session_id: str,
+    ):
+        should_update = (current_summary_text == NO_PREV_SUMMARY) or is_interval_hit
+
+        if should_update and messages:
+            window = self.max_messages_for_new_fact
+            if self._get_message_time(messages[-1]) is None:
+                # NOTE: Without timestamps there's no watermark, so only the latest
+                # window is summarized, as before.
+                messages = messages[-window:]
 
-            if should_update:
+            # NOTE: Every message after the watermark is folded into the summary, in
+            # chunks of the window, so the watermark never skips unsummarized messages.
+            new_chat_summary = current_summary_text
+            for start in range(0, len(messages), window):
                 new_chat_summary = await self._summarize_messages(
-                    messages=messages,
-                    prev_summary=current_summary_text,
+                    messages=messages[start : start + window],
+                    prev_summary=new_chat_summary,
+                )
+            try:
+                await self.db_utils.store_chat_summary(
+                    summary=new_chat_summary,
+                    user_id=user_id,
+                    session_id=session_id,
+                    summarized_until=self._get_message_time(messages[-1]),
                 )
-                await self.db_utils.store_chat_summary(summary=new_chat_summary)
                 logger.info(f"Chat summary updated.")
+            except SummaryConflictException as e:
+                # NOTE: Another writer already stored a newer summary. Keep that one.
+                logger.warning(f"Skipping stale summary update: {str(e)}")
+        else:
+            logger.info(f"Skipping summary update (interval not met)")
+
+    async def _run_fact_pipeline(
+        self,
+        messages: List[Message],
+        context_messages: List[Message],
+        summary: str,
+        user_id: str,
+        session_id: str,
+    ):
+        if not messages:
+            logger.info("Skipping fact extraction (no new messages).")
+            return
+
+        window = self.max_messages_for_new_fact
+        if self._get_message_time(messages[-1]) is None:
+            # NOTE: Without timestamps there's no watermark, so only the latest
+            # window is mined, as before.
+            messages = messages[-window:]
+
+        # NOTE: New messages are mined in chunks of the window, oldest first, and the
+        # watermark only moves past a chunk once its facts are stored. So when a run
+        # fails, its messages stay new and are mined (along with the next turn's) later.
+        for start in range(0, len(messages), window):
+            chunk = messages[start : start + window]
+            if (
+                self.extraction_gate is None
+                or await self.extraction_gate.should_extract(chunk)
+            ):
+                candidate_facts = await self._find_candidate_facts(
+                    chunk, summary, context_messages
+                )
+                if candidate_facts:
+                    await self._process_candidate_facts(
+                        candidate_facts, user_id, session_id
+                    )
+
+            extracted_until = self._get_message_time(chunk[-1])
+            if extracted_until is not None:
+                await self.db_utils.advance_extraction_watermark(
+                    user_id, session_id, extracted_until
+                )
+            context_messages = (
+                chunk[-self.fact_context_messages :]
+                if self.fact_context_messages
+                else []
+            )
+
+    def _get_message_time(self, msg: Message) -> Optional[datetime]:
+        created_at = getattr(msg, "created_at", None)
+        if not isinstance(created_at, datetime):
+            return None
+        if created_at.tzinfo is None:
+            return created_at.replace(tzinfo=timezone.utc)
+        return created_at
+
+    def _split_at_watermark(
+        self, messages: List[Message], watermark: Optional[datetime]
+    ) -> Tuple[List[Message], List[Message]]:
+        # Splits the (ordered) messages into the ones up to `watermark`, which were
+        # processed before, and the new ones after it. Without a timestamp on every
+        # message, there's no way to tell, so all of them count as new.
+        times = [self._get_message_time(msg) for msg in messages]
+        if watermark is None or None in times:
+            return [], messages
+
+        split_at = next(
+            (i for i, time in enumerate(times) if time > watermark), len(messages)
+        )
+        return messages[:split_at], messages[split_at:]
+
+    async def process_memory(
+        self,
+        messages: List[Message],
+        user_id: str = DEFAULT_USER_ID,
+        session_id: str = DEFAULT_SESSION_ID,
+    ):
+        # Facts and the graph are kept per user, the summary per (user, session).
+        # NOTE: Per-session watermarks make sure that every message is mined for facts
+        # (and summarized) once, so the LLM work per turn doesn't grow with the number
+        # of messages passed in. Older messages are only sent along as context.
+        try:
+            state = await self.db_utils.get_state(
+                user_id=user_id, session_id=session_id
+            )
+            current_summary_text = state.summary or NO_PREV_SUMMARY
+
+            processed_msgs, new_msgs = self._split_at_watermark(
+                messages, state.extracted_until
+            )
+            context_msgs = (
+                processed_msgs[-self.fact_context_messages :]
+                if self.fact_context_messages
+                else []
+            )
+
+            _, unsummarized_msgs = self._split_at_watermark(
+                messages, state.summarized_until
+            )
+            user_msg_count = self._count_user_messages(unsummarized_msgs)
+            if state.summarized_until is not None:
+                is_interval_hit = user_msg_count >= self.message_interval_for_summary
             else:
-                logger.info(f"Skipping summary update (interval not met)")
+                is_interval_hit = (
+                    user_msg_count % self.message_interval_for_summary == 0  # type: ignore
+                )
+
+            # NOTE: Summary only depends on the messages and the previous summary,
+            # so it can run alongside the fact pipeline.
+            await asyncio.gather(
+                self._run_fact_pipeline(
+                    new_msgs, context_msgs, current_summary_text, user_id, session_id
+                ),
+                self._update_summary(
+                    unsummarized_msgs,
+                    current_summary_text,
+                    is_interval_hit,
+                    user_id,
+                    session_id,
+                ),
+            )
 
         except Exception as e:
             raise Mem1Exception(message="Error while processing memory.", error=str(e))
 
-    async def load_memory(self, messages: List[Message]) -> List[Message]:
+    def _get_recency_boost(self, timestamp: Optional[int]) -> float:
+        if not self.recency_weight or timestamp is None:
+            return 0.0
+        age_days = max(0.0, (datetime.now().timestamp() - timestamp) / 86400)
+        return self.recency_weight * 0.5 ** (age_days / self.recency_half_life_days)
+
+    async def _retrieve_memories(self, query: str, user_id: str) -> List[str]:
+        logger.info("_retrieve_memories called")
+        if self.memory_retrieval_mode == MemoryRetrievalMode.ALL or not query:
+            user_memories = await self.vectordb_utils.retrieve_all_points(user_id) or []
+        else:
+            user_memories = await self.vectordb_utils.search_points(
+                text=query, user_id=user_id, limit=self.memory_top_k
+            )
+            user_memories = sorted(
+                user_memories,
+                key=lambda mem: (
+                    mem.score + self._get_recency_boost(mem.payload.get("timestamp"))
+                ),
+                reverse=True,
+            )
+
+        memories = [mem.payload.get("text") for mem in user_memories]
+        if self.memory_token_budget is not None:
+            memories = trim_to_token_budget(memories, self.memory_token_budget)
+            logger.debug(
+                f"Kept {len(memories)}/{len(user_memories)} memories within the token budget."
+            )
+        self._record_access(user_memories[: len(memories)])
+
+        return memories
+
+    async def setup(self, migrate: bool = True):
+        # Creates the Vector DB payload indexes and the GraphDB indexes and, optionally,
+        # backfills the properties they rely on for data written by older versions
+        # (which all goes to the default user).
         try:
-            msgs_copy = deepcopy(messages)
-            sys_msg = msgs_copy[0]
-            if sys_msg.role != "system":
-                logger.error(
-                    "Error while checking system message while loading memory. System message not found in the context."
-                )
-                raise Mem1Exception(
-                    message="Error while checking system message.",
-                    error="System message not found in the context.",
-                    suggestion="Make sure to include system message in the context.",
+            await self.vectordb_utils.setup()
+            await self.graphdb_utils.setup()
+            await self.db_utils.setup()
+            if migrate:
+                await self.graphdb_utils.migrate_normalized_names()
+                await self.graphdb_utils.migrate_tenants(DEFAULT_USER_ID)
+                await self.vectordb_utils.migrate_tenants(DEFAULT_USER_ID)
+                await self.db_utils.migrate_tenants(DEFAULT_USER_ID, DEFAULT_SESSION_ID)
+            logger.info("Mem1 client setup completed.")
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while setting up Mem1.",
+                error=str(e),
+                suggestion="Make sure the Vector DB, GraphDB and Database are reachable.",
+            )
+
+    def _get_conversation_id(self, user_id: str, session_id: str) -> str:
+        return f"{user_id}:{session_id}"
+
+    def submit_memory(
+        self,
+        messages: List[Message],
+        user_id: str = DEFAULT_USER_ID,
+        session_id: str = DEFAULT_SESSION_ID,
+    ) -> asyncio.Future:
+        # Queues `process_memory` to run in the background and returns right away.
+        # Ops of the same session are processed in the order they were submitted.
+        try:
+            return self.write_queue.submit(
+                self._get_conversation_id(user_id, session_id),
+                deepcopy(messages),
+                user_id=user_id,
+                session_id=session_id,
+            )
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while submitting memory for processing.",
+                error=str(e),
+                suggestion="Make sure `submit_memory` is not called after `aclose`.",
+            )
+
+    async def aclose(self, timeout: Optional[float] = None):
+        # Waits for all the submitted memory ops to finish and stops the workers.
+        await self.write_queue.close(timeout=timeout)
+        await self._flush_access_stamps()
+        self.entity_cache.save()
+        self.embedder.close()
+        logger.info("Mem1 client closed.")
+
+    async def delete_memories(self, user_id: str = DEFAULT_USER_ID):
+        # Deletes every stored fact of the user, from whichever vector store is used.
+        try:
+            await self.vectordb_utils.delete_all_points(user_id)
+            self._fact_counts.pop(user_id, None)
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while deleting the memories.",
+                error=str(e),
+            )
+
+    async def delete_user_data(self, user_id: str = DEFAULT_USER_ID):
+        # Wipes everything Mem1 keeps for the user: facts, graph nodes, entity index
+        # points, cached entity resolutions, and the summaries and watermarks of all
+        # of the user's sessions.
+        try:
+            # NOTE: Ops already queued for the user would write facts back after the wipe.
+            prefix = self._get_conversation_id(user_id, "")
+            await asyncio.gather(
+                *(
+                    self.write_queue.wait_for_pending(
+                        conversation_id, timeout=self.read_your_writes_timeout
+                    )
+                    for conversation_id in self.write_queue.pending_conversations()
+                    if conversation_id.startswith(prefix)
                 )
+            )
 
-            user_memories = await self.vectordb_utils.retrieve_all_points()
-            if user_memories is None:
-                return msgs_copy
+            lock = self._vector_write_locks.setdefault(user_id, asyncio.Lock())
+            async with lock:
+                await self.vectordb_utils.delete_all_points(user_id)
+                self._fact_counts.pop(user_id, None)
+            await self.graphdb_utils.delete_all_nodes(user_id)
+            await self.entity_index.delete_all_entities(user_id)
+            await self.db_utils.delete_chat_summaries(user_id)
+            logger.info(f"Deleted all the memory data of user {user_id}.")
 
-            memories_arr = [mem.payload.get("text") for mem in user_memories]
-            memories_arr.insert(
-                0, "\n<Memory-Block>\n**Here are some long-term memories of the user:**"
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while deleting the user data.",
+                error=str(e),
             )
-            memories_arr.append("</Memory-Block>")
-            memories_str = "\n".join(memories_arr)
 
-            last_user_msg = next(
-                (m.content for m in reversed(messages) if m.role == "user"), ""
+    async def get_summary(
+        self, user_id: str = DEFAULT_USER_ID, session_id: str = DEFAULT_SESSION_ID
+    ) -> Optional[str]:
+        # Served from the summary cache after the first read of the session.
+        try:
+            return await self.db_utils.get_chat_summary(user_id, session_id)
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while getting the chat summary.",
+                error=str(e),
+            )
+
+    async def delete_summary(
+        self, user_id: str = DEFAULT_USER_ID, session_id: str = DEFAULT_SESSION_ID
+    ):
+        try:
+            await self.db_utils.delete_chat_summary(user_id, session_id)
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while deleting the chat summary.",
+                error=str(e),
+            )
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+
+        self._prompt_tokens += usage.prompt_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is not None and details.cached_tokens:
+            self._cached_prompt_tokens += details.cached_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "prompt_cache": {
+                "prompt_tokens": self._prompt_tokens,
+                "cached_tokens": self._cached_prompt_tokens,
+                "hit_ratio": (
+                    self._cached_prompt_tokens / self._prompt_tokens
+                    if self._prompt_tokens
+                    else 0.0
+                ),
+            },
+            "entity_cache": self.entity_cache.stats(),
+            "summary_cache": self.db_utils.stats(),
+            "extraction_gate": (
+                self.extraction_gate.stats()
+                if self.extraction_gate is not None
+                else None
+            ),
+            "embedding_cache": (
+                self.embedding_cache.stats() if self.embedding_cache else None
+            ),
+        }
+
+    async def _with_deadline(self, coro: Coroutine, source: str, default: Any):
+        # A slow or failing store should only cost its own part of the context,
+        # not stall the whole turn.
+        try:
+            return await asyncio.wait_for(coro, timeout=self.memory_source_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out while reading from {source}. Skipping it.")
+            return default
+        except Exception as e:
+            logger.error(f"Error while reading from {source}: {repr(e)}. Skipping it.")
+            return default
+
+    async def retrieve_memory_context(
+        self,
+        query: str,
+        user_id: str = DEFAULT_USER_ID,
+        session_id: str = DEFAULT_SESSION_ID,
+    ) -> str:
+        try:
+            # NOTE: Read-your-writes: memories from the previous turn may still be
+            # getting processed in the background, so wait for them first. The wait is
+            # on the critical path of the turn, so it gets no more than the deadline of
+            # a memory source. When the ops take longer, the turn goes on with the
+            # memories stored so far.
+            timeouts = [
+                timeout
+                for timeout in (
+                    self.read_your_writes_timeout,
+                    self.memory_source_timeout,
+                )
+                if timeout is not None
+            ]
+            await self.write_queue.wait_for_pending(
+                self._get_conversation_id(user_id, session_id),
+                timeout=min(timeouts, default=None),
+            )
+
+            memories_arr, graph_context = await asyncio.gather(
+                self._with_deadline(
+                    self._retrieve_memories(query, user_id),
+                    source="Vector DB",
+                    default=[],
+                ),
+                self._with_deadline(
+                    self._retrieve_graph_context(query, user_id),
+                    source="Graph DB",
+                    default="",
+                ),
             )
-            graph_context = await self._retrieve_graph_context(last_user_msg)
+
+            memories_str = ""
+            if memories_arr:
+                memories_arr.insert(
+                    0,
+                    "\n<Memory-Block>\n**Here are some long-term memories of the user:**",
+                )
+                memories_arr.append("</Memory-Block>")
+                memories_str = "\n".join(memories_arr)
+
             if graph_context:
-                memories_str += graph_context
+                memories_str += f"\n{graph_context}"
+
+            return memories_str
+
+        except Exception as e:
+            raise Mem1Exception(
+                message="Error while retrieving memory context",
+                error=str(e),
+            )
+
+    def _check_system_message(self, messages: List[Message]):
+        if not messages or messages[0].role != "system":
+            logger.error(
+                "Error while checking system message while loading memory. System message not found in the context."
+            )
+            raise Mem1Exception(
+                message="Error while checking system message.",
+                error="System message not found in the context.",
+                suggestion="Make sure to include system message in the context.",
+            )
 
-            msgs_copy[0].content += memories_str
+    def inject_memory(
+        self, messages: List[Message], memory_context: str
+    ) -> List[Message]:
+        self._check_system_message(messages)
+        msgs_copy = deepcopy(messages)
+        if not memory_context:
             return msgs_copy
 
+        match self.memory_injection_mode:
+            case MemoryInjectionMode.SYSTEM_PROMPT:
+                msgs_copy[0].content += memory_context
+
+            case MemoryInjectionMode.LATE_MESSAGE:
+                # NOTE: Memories change from turn to turn. Keeping them out of the system
+                # message leaves everything before the latest user message byte-identical
+                # across turns, so the provider's prefix cache can serve it. They're put
+                # in that user message (tagged) rather than in a system message of their
+                # own, because many chat templates only allow a system message first
+                # and require user/assistant turns to alternate.
+                last_user_msg = next(
+                    (msg for msg in reversed(msgs_copy[1:]) if msg.role == "user"),
+                    None,
+                )
+                if last_user_msg is None:
+                    msgs_copy[0].content += memory_context
+                else:
+                    last_user_msg.content = (
+                        f"<Memory-Context>\n{memory_context.strip()}\n</Memory-Context>"
+                        f"\n\n{last_user_msg.content}"
+                    )
+
+        return msgs_copy
+
+    async def load_memory(
+        self,
+        messages: List[Message],
+        user_id: str = DEFAULT_USER_ID,
+        session_id: str = DEFAULT_SESSION_ID,
+    ) -> List[Message]:
+        try:
+            self._check_system_message(messages)
+
+            last_user_msg = next(
+                (m.content for m in reversed(messages) if m.role == "user"), ""
+            )
+            memory_context = await self.retrieve_memory_context(
+                last_user_msg, user_id=user_id, session_id=session_id
+            )
+            return self.inject_memory(messages, memory_context)
+
         except Exception as e:
             raise Mem1Exception(
                 message="Error while loading memory",
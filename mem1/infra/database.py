@@ -1,37 +1,199 @@
 import asyncio
-from beanie import Document
+from datetime import datetime, timezone
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, ReturnDocument
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+from typing import Any, Dict, Optional
+
+from ..utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
 
+class DatabaseException(Exception): ...
+
+
+class SummaryConflictException(DatabaseException):
+    # Raised when the stored summary is newer than the one the write was based on.
+    ...
+
+
+class SummaryState(BaseModel):
+    summary: Optional[str] = None
+    version: int = 0  # 0 means "no summary yet".
+    # Watermarks: `created_at` of the last message covered by the summary, and of the
+    # last message facts were extracted from.
+    summarized_until: Optional[datetime] = None
+    extracted_until: Optional[datetime] = None
+
+
+_STATE_PROJECTION = {"_id": False, "user_id": False, "session_id": False}
+
+
+def _to_state(doc: Optional[Dict[str, Any]]) -> SummaryState:
+    if doc is None:
+        return SummaryState()
+
+    doc.pop("updated_at", None)
+    doc.setdefault("version", 1)
+    for field in ("summarized_until", "extracted_until"):
+        # NOTE: Mongo returns naive datetimes (in UTC) unless the client is tz-aware.
+        if doc.get(field) is not None and doc[field].tzinfo is None:
+            doc[field] = doc[field].replace(tzinfo=timezone.utc)
+    return SummaryState(**doc)
+
+
 class DatabaseUtils:
-    def __init__(self, db_client: AsyncIOMotorClient, collection: Document):
+    # Chat summaries in a Mem1-owned collection, one document per (user_id, session_id):
+    # {user_id, session_id, summary, version, updated_at, summarized_until,
+    # extracted_until}. Reads are served from a write-through cache, and every summary
+    # write is a single conditional upsert on `version` (optimistic concurrency), so a
+    # stale writer can't overwrite a newer summary.
+    def __init__(
+        self,
+        db_client: AsyncIOMotorClient,
+        database_name: str,
+        collection_name: Optional[str] = "chat_summary",
+        cache_size: Optional[int] = 1024,
+    ):
         self.client = db_client
-        self.collection = collection
-        # NOTE: For now, I am taking the collection from the assistant [bad practice :(],
-        # but I will change this entire thing soon.
-        # TODO: Make the collection inside Mem1 and add it into the client from here.
+        self.collection = None
+        if self.client is not None:
+            self.collection = self.client[database_name][collection_name]
+        # (user_id, session_id) -> SummaryState
+        self._cache = LRUCache(max_size=cache_size)
 
-    async def store_chat_summary(self, summary: str):
-        if self.client is None:
+    def _check_client(self):
+        if self.collection is None:
             logger.error(f"Database client is not initialized. Initialize it first.")
-            raise Exception(f"Database client is not initialized. Initialize it first.")
-
-        chat_summary = await self.collection.find_all().to_list()
-        if chat_summary:
-            chat_summary = chat_summary[0]
-            chat_summary.summary = summary
-            await chat_summary.save()
-        else:
-            chat_summary = self.collection(summary=summary)
-            await chat_summary.insert()
-
-    async def get_chat_summary(self):
-        if self.client is None:
-            logger.error(f"DB client is not initialized. Initialize if first.")
-            raise Exception(f"DB client is not initialized. Initialize if first.")
-
-        chat_summary = await self.collection.find_one()
-        return chat_summary.summary if chat_summary else None
+            raise DatabaseException(
+                f"Database client is not initialized. Initialize it first."
+            )
+
+    async def setup(self):
+        self._check_client()
+        await self.collection.create_index(
+            [("user_id", ASCENDING), ("session_id", ASCENDING)], unique=True
+        )
+
+    async def get_state(self, user_id: str, session_id: str) -> SummaryState:
+        key = (user_id, session_id)
+        state = self._cache.get(key)
+        if state is not None:
+            return state
+
+        self._check_client()
+        doc = await self.collection.find_one(
+            {"user_id": user_id, "session_id": session_id},
+            projection=_STATE_PROJECTION,
+        )
+        state = _to_state(doc)
+        self._cache.set(key, state)
+        return state
+
+    async def get_chat_summary(self, user_id: str, session_id: str) -> Optional[str]:
+        state = await self.get_state(user_id, session_id)
+        return state.summary
+
+    async def store_chat_summary(
+        self,
+        summary: str,
+        user_id: str,
+        session_id: str,
+        expected_version: Optional[int] = None,
+        summarized_until: Optional[datetime] = None,
+    ) -> int:
+        # Writes the summary if the stored one is still at `expected_version` (by
+        # default, the version this process last saw) and returns the new version.
+        key = (user_id, session_id)
+        if expected_version is None:
+            state = await self.get_state(user_id, session_id)
+            expected_version = state.version
+
+        update = {"summary": summary, "updated_at": datetime.now(timezone.utc)}
+        if summarized_until is not None:
+            update["summarized_until"] = summarized_until
+
+        self._check_client()
+        try:
+            doc = await self.collection.find_one_and_update(
+                {
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "version": expected_version,
+                },
+                {"$set": update, "$inc": {"version": 1}},
+                # NOTE: Only the very first write may create the document. For later
+                # ones, a version mismatch must fail instead of inserting a duplicate.
+                upsert=expected_version == 0,
+                projection=_STATE_PROJECTION,
+                return_document=ReturnDocument.AFTER,
+            )
+
+        except DuplicateKeyError:
+            doc = None
+
+        if doc is None:
+            self._cache.invalidate(key)
+            raise SummaryConflictException(
+                f"Summary of {user_id}/{session_id} changed since version {expected_version}."
+            )
+
+        state = _to_state(doc)
+        self._cache.set(key, state)
+        return state.version
+
+    async def advance_extraction_watermark(
+        self, user_id: str, session_id: str, extracted_until: datetime
+    ):
+        # `$max` keeps the watermark from moving back if writers race.
+        key = (user_id, session_id)
+        self._check_client()
+        for attempt in range(2):
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"user_id": user_id, "session_id": session_id},
+                    {
+                        "$max": {"extracted_until": extracted_until},
+                        "$setOnInsert": {"version": 0},
+                    },
+                    upsert=True,
+                    projection=_STATE_PROJECTION,
+                    return_document=ReturnDocument.AFTER,
+                )
+                self._cache.set(key, _to_state(doc))
+                return
+
+            except DuplicateKeyError:
+                # NOTE: Another writer created the document first. Update that one.
+                if attempt:
+                    raise
+
+    async def delete_chat_summary(self, user_id: str, session_id: str):
+        self._check_client()
+        await self.collection.delete_one({"user_id": user_id, "session_id": session_id})
+        self._cache.invalidate((user_id, session_id))
+
+    async def delete_chat_summaries(self, user_id: str):
+        # Deletes the summaries (and watermarks) of all the sessions of the user.
+        self._check_client()
+        await self.collection.delete_many({"user_id": user_id})
+        self._cache.invalidate_where(lambda key, _: key[0] == user_id)
+
+    async def migrate_tenants(self, default_user_id: str, default_session_id: str):
+        # Assigns the summary written before tenants existed to the default tenant
+        # and gives documents written before versioning a starting version.
+        self._check_client()
+        await self.collection.update_many(
+            {"user_id": {"$exists": False}},
+            {"$set": {"user_id": default_user_id, "session_id": default_session_id}},
+        )
+        await self.collection.update_many(
+            {"version": {"$exists": False}},
+            {"$set": {"version": 1}},
+        )
+
+    def stats(self):
+        return self._cache.stats()
@@ -1,57 +1,121 @@
 import asyncio
-import httpx
 import logging
-from typing import List, Optional
+from typing import List, Optional, Set, Tuple
+
+from .embedding_backends import EmbedderException, EmbeddingBackend
+from .embedding_cache import EmbeddingCache
 
 
 logger = logging.getLogger(__name__)
 
 
 class EmbedderUtils:
-    def __init__(self, embedder_client: httpx.AsyncClient):
-        self.client = embedder_client
-        self.embed_endpoint = "/embed"
-
-    async def embed(self, text: str) -> List[float]:
-        try:
-            payload = {"inputs": [text]}
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        cache: Optional[EmbeddingCache] = None,
+        coalesce_window: Optional[float] = None,
+        coalesce_max_batch_size: Optional[int] = 32,
+    ):
+        self.backend = backend
+        self.cache = cache
+        self._model_id_lock = asyncio.Lock()
 
-            response = await self.client.post(self.embed_endpoint, json=payload)
-            response.raise_for_status()
-            embeddings = response.json()
+        # Opt-in: concurrent embed() calls that arrive within `coalesce_window`
+        # seconds (or until `coalesce_max_batch_size` texts) share one request.
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_batch_size = coalesce_max_batch_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
 
+    async def embed(self, text: str) -> List[float]:
+        if not self.coalesce_window:
+            embeddings = await self.embed_batch([text])
             return embeddings[0]
 
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error occurred: {str(e)}")
-            raise EmbedderException(f"HTTP error occurred: {str(e)}")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
 
-        except httpx.RequestError as e:
-            logger.error(
-                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
-            )
-            raise EmbedderException(
-                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
+        if len(self._pending) >= self.coalesce_max_batch_size:
+            self._flush_pending()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.coalesce_window, self._flush_pending
             )
 
-    async def embed_batch(self, text: List[str]) -> List[float]:
+        return await future
+
+    def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._embed_pending(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _embed_pending(self, batch: List[Tuple[str, asyncio.Future]]):
         try:
-            payload = {"inputs": text}
+            embeddings = await self.embed_batch([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
 
-            response = await self.client.post(self.embed_endpoint, json=payload)
-            response.raise_for_status()
-            embeddings = response.json()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
 
-            return embeddings
+    async def _ensure_cache_model_id(self) -> bool:
+        # Keys the cache on the model the backend really runs, resolved once.
+        if self.cache.model_id is not None:
+            return True
 
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error occurred: {str(e)}")
-            raise EmbedderException(f"HTTP error occurred: {str(e)}")
+        async with self._model_id_lock:
+            if self.cache.model_id is None:
+                try:
+                    get_model_id = getattr(self.backend, "get_model_id", None)
+                    if get_model_id is not None:
+                        model_id = await get_model_id()
+                    else:
+                        model_id = self.backend.model_name
+                    self.cache.set_model_id(model_id)
 
-        except httpx.RequestError as e:
-            logger.error(
-                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
-            )
-            raise EmbedderException(
-                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
-            )
+                except Exception as e:
+                    # NOTE: Without a reliable key, cached vectors could come from
+                    # another model, so the cache is skipped until it's known.
+                    logger.warning(
+                        f"Could not identify the embedding model, not caching: {str(e)}"
+                    )
+                    return False
+
+        return True
+
+    async def embed_batch(self, text: List[str]) -> List[List[float]]:
+        if self.cache is None or not await self._ensure_cache_model_id():
+            embeddings = await self.backend.embed_batch(text)
+            return embeddings.tolist()
+
+        # Only the texts that are not cached yet go to the embedder.
+        cached = self.cache.get_many(text)
+        misses = list(dict.fromkeys(t for t, vec in zip(text, cached) if vec is None))
+        fresh = {}
+        if misses:
+            embeddings = await self.backend.embed_batch(misses)
+            self.cache.put_many(misses, embeddings)
+            fresh = dict(zip(misses, embeddings))
+
+        return [
+            (vec if vec is not None else fresh[t]).tolist()
+            for t, vec in zip(text, cached)
+        ]
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.flush()
+        if hasattr(self.backend, "close"):
+            self.backend.close()
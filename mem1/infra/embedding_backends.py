@@ -0,0 +1,189 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import httpx
+import logging
+import numpy as np
+import os
+from typing import List, Optional, Protocol, runtime_checkable
+
+from ..utils.text import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbedderException(Exception): ...
+
+
+@runtime_checkable
+class EmbeddingBackend(Protocol):
+    model_name: str
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Returns a float32 array of shape (len(texts), dimension)."""
+        ...
+
+    async def get_model_id(self) -> str:
+        """Identifies the model that actually produces the vectors (used as cache key)."""
+        ...
+
+
+class TEIEmbeddingBackend:
+    # Text Embeddings Inference server reached over HTTP.
+    def __init__(self, client: httpx.AsyncClient, model_name: str = "default"):
+        self.client = client
+        self.model_name = model_name
+        self.embed_endpoint = "/embed"
+        self.info_endpoint = "/info"
+
+    async def get_model_id(self) -> str:
+        # `model_name` is only a label, the server knows which model it really serves.
+        try:
+            response = await self.client.get(self.info_endpoint)
+            response.raise_for_status()
+            info = response.json()
+
+            model_id = f"tei:{info['model_id']}"
+            if info.get("model_sha"):
+                model_id += f"@{info['model_sha']}"
+            return model_id
+
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.error(f"Error while getting the TEI model info: {str(e)}")
+            raise EmbedderException(f"Error while getting the TEI model info: {str(e)}")
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        try:
+            payload = {"inputs": texts}
+
+            response = await self.client.post(self.embed_endpoint, json=payload)
+            response.raise_for_status()
+            embeddings = response.json()
+
+            return np.asarray(embeddings, dtype=np.float32)
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error occurred: {str(e)}")
+            raise EmbedderException(f"HTTP error occurred: {str(e)}")
+
+        except httpx.RequestError as e:
+            logger.error(
+                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
+            )
+            raise EmbedderException(
+                f"An error occurred while requesting {e.request.url!r}: {str(e)}"
+            )
+
+
+class ONNXEmbeddingBackend:
+    # In-process CPU embedder. Expects an exported sentence-transformers model in
+    # `model_dir`, i.e. `model.onnx` and `tokenizer.json`. Needs the `onnx` extra.
+    def __init__(
+        self,
+        model_dir: str,
+        model_name: Optional[str] = None,
+        max_length: Optional[int] = 256,
+        num_threads: Optional[int] = 2,
+        normalize: Optional[bool] = True,
+    ):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+        except ImportError as e:
+            raise EmbedderException(
+                f"ONNX embedder needs `onnxruntime` and `tokenizers` installed: {str(e)}"
+            )
+
+        model_path = os.path.join(model_dir, "model.onnx")
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise EmbedderException(
+                f"Expected model.onnx and tokenizer.json in {model_dir}."
+            )
+
+        self.model_name = model_name or os.path.basename(os.path.normpath(model_dir))
+        self.model_path = os.path.abspath(model_path)
+        self.normalize = normalize
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        # Inference is CPU bound, so it runs off the event loop.
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="onnx-embedder"
+        )
+
+    def _embed_sync(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over the non-padding tokens.
+        mask = attention_mask[..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(
+            mask.sum(axis=1), 1e-9, None
+        )
+        if self.normalize:
+            embeddings /= np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+            )
+
+        return embeddings.astype(np.float32)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._embed_sync, texts)
+
+        except Exception as e:
+            logger.error(f"Error while running the ONNX embedder: {str(e)}")
+            raise EmbedderException(f"Error while running the ONNX embedder: {str(e)}")
+
+    async def get_model_id(self) -> str:
+        return f"onnx:{self.model_path}"
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class HashingEmbeddingBackend:
+    # Deterministic feature-hashing embedder with no model and no I/O. Texts
+    # sharing words get similar vectors, which is enough for tests and benchmarks.
+    def __init__(self, dimension: Optional[int] = 384):
+        self.dimension = dimension
+        self.model_name = f"hashing-{dimension}"
+
+    def _embed_text(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text) or [text]:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimension] += sign
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get_model_id(self) -> str:
+        return self.model_name
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack([self._embed_text(text) for text in texts])
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCacheException(Exception): ...
+
+
+class _DiskTier:
+    # Vectors live in one memory-mapped float32 file (one row per text) and the
+    # key -> row mapping in a JSON index file next to it.
+    # NOTE: Rows are never reused (see `put`), so the tier is capped by `max_entries`
+    # instead of evicting. Once it's full, new embeddings only go to the memory tier.
+    def __init__(
+        self, path: str, max_entries: Optional[int] = None, grow_by: int = 1024
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.grow_by = grow_by
+        self.index_path = os.path.join(path, "index.json")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+
+        self.index: Dict[str, int] = {}
+        self.dimension: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._unflushed = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return
+
+        with open(self.index_path) as f:
+            data = json.load(f)
+        self.dimension = data["dimension"]
+        self.index = data["keys"]
+        self._open(os.path.getsize(self.vectors_path) // (4 * self.dimension))
+        logger.info(f"Loaded {len(self.index)} cached embeddings from {self.path}.")
+
+    def _open(self, capacity: int):
+        self._vectors = np.memmap(
+            self.vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dimension),
+        )
+        self._capacity = capacity
+
+    def _grow(self, min_capacity: int):
+        capacity = max(min_capacity, self._capacity + self.grow_by)
+        if self.max_entries is not None:
+            capacity = min(capacity, self.max_entries)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._open(capacity)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.index.get(key)
+        if row is None or row >= self._capacity:
+            return None
+        return np.array(self._vectors[row])
+
+    def put(self, key: str, vector: np.ndarray):
+        if key in self.index:
+            return
+
+        if self.dimension is None:
+            self.dimension = len(vector)
+        elif len(vector) != self.dimension:
+            logger.warning(
+                f"Skipping disk cache for embedding of size {len(vector)} (expected {self.dimension})."
+            )
+            return
+
+        # NOTE: Rows are handed out in order, so rows written after the last index
+        # flush (e.g. before a crash) are simply overwritten on the next run.
+        row = len(self.index)
+        if self.max_entries is not None and row >= self.max_entries:
+            return
+        if row >= self._capacity:
+            self._grow(row + 1)
+        self._vectors[row] = vector
+        self.index[key] = row
+
+        self._unflushed += 1
+        if self._unflushed >= self.grow_by:
+            self.flush()
+
+    def flush(self):
+        if self._vectors is None:
+            return
+
+        self._vectors.flush()
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dimension": self.dimension, "keys": self.index}, f)
+        os.replace(tmp_path, self.index_path)
+        self._unflushed = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._capacity * (self.dimension or 0) * 4
+
+
+class EmbeddingCache:
+    # Content-addressed cache of embeddings, keyed by (model id, text hash).
+    # A bounded in-memory LRU tier sits in front of an optional, capped on-disk tier.
+    # NOTE: The model id comes from the embedding backend (see `get_model_id`), which
+    # may need I/O, so it can be set after construction with `set_model_id`.
+    def __init__(
+        self,
+        model_id: Optional[str] = None,
+        max_entries: Optional[int] = 4096,
+        disk_path: Optional[str] = None,
+        disk_max_entries: Optional[int] = 100_000,
+    ):
+        self.model_id = None
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._disk = None
+        if model_id is not None:
+            self.set_model_id(model_id)
+
+    def set_model_id(self, model_id: str):
+        self.model_id = model_id
+        if self.disk_path:
+            # One directory per model, since different models have different dimensions.
+            model_dir = re.sub(r"[^\w.-]", "_", model_id)
+            self._disk = _DiskTier(
+                os.path.join(self.disk_path, model_dir),
+                max_entries=self.disk_max_entries,
+            )
+
+    def _get_key(self, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_id}:{text_hash}"
+
+    def _put_in_memory(self, key: str, vector: np.ndarray):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self.max_entries is not None and len(self._memory) > self.max_entries:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        results = []
+        for text in texts:
+            key = self._get_key(text)
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            elif self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self._put_in_memory(key, vector)
+
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            results.append(vector)
+
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[Any]):
+        try:
+            for text, vector in zip(texts, vectors):
+                key = self._get_key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._put_in_memory(key, vector)
+                if self._disk is not None:
+                    self._disk.put(key, vector)
+
+        except Exception as e:
+            logger.error(f"Error while caching embeddings: {str(e)}")
+
+    def flush(self):
+        try:
+            if self._disk is not None:
+                self._disk.flush()
+
+        except Exception as e:
+            logger.error(f"Error while flushing the embedding cache: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk.index) if self._disk else 0,
+            "disk_max_entries": self.disk_max_entries,
+            "disk_bytes": self._disk.nbytes if self._disk else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from qdrant_client import AsyncQdrantClient, models
+from typing import List, Optional, Tuple
+import uuid
+
+from .embedder import EmbedderUtils
+from ..utils.text import normalize_name
+
+
+logger = logging.getLogger(__name__)
+
+
+class EntityIndexException(Exception): ...
+
+
+class EntityIndexUtils:
+    # Side Qdrant collection with one point per graph node, used to find entity
+    # resolution candidates by embedding similarity instead of scanning the graph.
+    def __init__(
+        self,
+        vectordb_client: AsyncQdrantClient,
+        collection_name: str,
+        embedder: EmbedderUtils,
+    ):
+        self.client = vectordb_client
+        self.collection_name = collection_name
+        self.embedder = embedder
+        self._is_ready = False
+        self._setup_lock = asyncio.Lock()
+
+    def _get_point_id(self, name: str, entity_type: str, user_id: str) -> str:
+        # Same node (tenant + type + normalized name) always maps to the same point.
+        return str(
+            uuid.uuid5(
+                uuid.NAMESPACE_URL,
+                f"{user_id}:{entity_type}:{normalize_name(name)}",
+            )
+        )
+
+    async def _ensure_collection(self, dimension: int):
+        if self._is_ready:
+            return
+
+        async with self._setup_lock:
+            if self._is_ready:
+                return
+
+            if not await self.client.collection_exists(self.collection_name):
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=models.VectorParams(
+                        size=dimension,
+                        distance=models.Distance.COSINE,
+                    ),
+                )
+                await self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name="entity_type",
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                )
+                logger.info(f"Created entity index collection {self.collection_name}.")
+
+            # NOTE: Outside the creation branch, so collections created before
+            # tenants existed get the index too (creating it again is a no-op).
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="user_id",
+                field_schema=models.KeywordIndexParams(
+                    type=models.KeywordIndexType.KEYWORD, is_tenant=True
+                ),
+            )
+            self._is_ready = True
+
+    async def add_entities(
+        self,
+        entities: List[Tuple[str, str]],
+        user_id: str,
+        vectors: Optional[List[List[float]]] = None,
+    ):
+        try:
+            if not entities:
+                return
+
+            if vectors is None:
+                vectors = await self.embedder.embed_batch(
+                    [name for name, _ in entities]
+                )
+            await self._ensure_collection(len(vectors[0]))
+
+            await self.client.upsert(
+                collection_name=self.collection_name,
+                points=[
+                    models.PointStruct(
+                        id=self._get_point_id(name, entity_type, user_id),
+                        vector=vector,
+                        payload={
+                            "name": name,
+                            "entity_type": entity_type,
+                            "user_id": user_id,
+                        },
+                    )
+                    for (name, entity_type), vector in zip(entities, vectors)
+                ],
+            )
+
+        except Exception as e:
+            logger.error(f"Error while adding entities to the entity index: {str(e)}")
+            raise EntityIndexException(
+                f"Error while adding entities to the entity index."
+            )
+
+    async def delete_entities(self, entities: List[Tuple[str, str]], user_id: str):
+        try:
+            if not entities or not await self.client.collection_exists(
+                self.collection_name
+            ):
+                return
+
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(
+                    points=[
+                        self._get_point_id(name, entity_type, user_id)
+                        for name, entity_type in entities
+                    ]
+                ),
+            )
+
+        except Exception as e:
+            logger.error(f"Error while deleting entities: {str(e)}")
+            raise EntityIndexException(
+                f"Error while deleting entities from the entity index."
+            )
+
+    async def delete_all_entities(self, user_id: str):
+        # Deletes the points of every node of one tenant.
+        try:
+            if not await self.client.collection_exists(self.collection_name):
+                return
+
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="user_id", match=models.MatchValue(value=user_id)
+                        )
+                    ]
+                ),
+            )
+
+        except Exception as e:
+            logger.error(f"Error while deleting entities of {user_id}: {str(e)}")
+            raise EntityIndexException(
+                f"Error while deleting entities from the entity index."
+            )
+
+    async def search_entities(
+        self, entities: List[Tuple[str, str]], user_id: str, limit: int = 5
+    ) -> Tuple[List[List[float]], List[List[models.ScoredPoint]]]:
+        # Nearest indexed nodes of the same tenant and entity type for every (name, type) pair.
+        # Returns the embeddings of the inputs too, so they can be reused for indexing.
+        try:
+            if not entities:
+                return [], []
+
+            vectors = await self.embedder.embed_batch([name for name, _ in entities])
+            await self._ensure_collection(len(vectors[0]))
+
+            search_results = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=vector,
+                        filter=models.Filter(
+                            must=[
+                                models.FieldCondition(
+                                    key="user_id",
+                                    match=models.MatchValue(value=user_id),
+                                ),
+                                models.FieldCondition(
+                                    key="entity_type",
+                                    match=models.MatchValue(value=entity_type),
+                                ),
+                            ]
+                        ),
+                        limit=limit,
+                        with_payload=True,
+                        with_vector=False,
+                    )
+                    for (_, entity_type), vector in zip(entities, vectors)
+                ],
+            )
+            return vectors, [res.points for res in search_results]
+
+        except Exception as e:
+            logger.error(f"Error while searching the entity index: {str(e)}")
+            raise EntityIndexException(f"Error while searching the entity index.")
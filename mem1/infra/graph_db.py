@@ -1,13 +1,61 @@
-from neo4j import AsyncDriver
-from typing import Any, Dict, List, Optional
+import logging
+from neo4j import AsyncDriver, AsyncManagedTransaction
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from ..utils.enums import EntityType
+from ..utils.models import GraphTriplets
+from ..utils.text import normalize_name
+
+
+if TYPE_CHECKING:
+    from .entity_index import EntityIndexUtils
+
+
+logger = logging.getLogger(__name__)
 
 
 class GraphDBException(Exception): ...
 
 
+# NOTE: Every node also gets the common `Entity` label and a `name_norm` property
+# (normalized name, set at write time), so that lookups by name can use the
+# `:Entity(name_norm)` index instead of scanning the whole graph.
+# Nodes are partitioned by tenant through their `user_id` property: a node is
+# identified by (label, user_id, name) and every query is scoped to one `user_id`.
+COMMON_LABEL = "Entity"
+
+
 class GraphDBUtils:
-    def __init__(self, driver: AsyncDriver):
+    def __init__(
+        self, driver: AsyncDriver, entity_index: Optional["EntityIndexUtils"] = None
+    ):
         self.driver = driver
+        # Deleted nodes are removed from the entity index too, so they stop
+        # showing up as resolution candidates.
+        self.entity_index = entity_index
+        # Called with the node name (or None for "every node") and the tenant whenever
+        # nodes are deleted or get their name or tenant rewritten, so that caches built
+        # on top of the graph can drop stale entries. Upserts don't notify: they only
+        # create nodes or match existing ones by exact name, which leaves every earlier
+        # resolution valid. Code that merges or renames nodes outside of this class must
+        # call `Mem1.invalidate_entity_cache` itself.
+        self._node_change_listeners: List[
+            Callable[[Optional[str], Optional[str]], None]
+        ] = []
+
+    def add_node_change_listener(
+        self, listener: Callable[[Optional[str], Optional[str]], None]
+    ):
+        self._node_change_listeners.append(listener)
+
+    def _notify_node_change(
+        self, name: Optional[str] = None, user_id: Optional[str] = None
+    ):
+        for listener in self._node_change_listeners:
+            try:
+                listener(name, user_id)
+            except Exception as e:
+                logger.error(f"Error in node change listener: {str(e)}")
 
     async def _execute_query(self, query, parameters: Optional[Dict[str, Any]] = None):
         try:
@@ -18,6 +66,118 @@ class GraphDBUtils:
         except Exception as e:
             raise GraphDBException(f"Error while executing query for GraphDB")
 
+    @staticmethod
+    async def _run_in_transaction(
+        tx: AsyncManagedTransaction,
+        statements: List[Tuple[str, Optional[Dict[str, Any]]]],
+    ):
+        records = []
+        for query, parameters in statements:
+            result = await tx.run(query, parameters)
+            records = [record.data() async for record in result]
+        return records
+
+    # NOTE: `execute_read` / `execute_write` run the work in a managed transaction,
+    # which the driver retries on transient errors (e.g. conflicting concurrent writes)
+    # for up to `max_transaction_retry_time` (set on the driver).
+    async def _execute_read(self, query, parameters: Optional[Dict[str, Any]] = None):
+        try:
+            async with self.driver.session() as session:
+                return await session.execute_read(
+                    self._run_in_transaction, [(query, parameters)]
+                )
+
+        except Exception as e:
+            raise GraphDBException(f"Error while executing read query for GraphDB")
+
+    async def _execute_write(
+        self, statements: List[Tuple[str, Optional[Dict[str, Any]]]]
+    ):
+        # Runs all the statements in a single write transaction and
+        # returns the records of the last one.
+        try:
+            async with self.driver.session() as session:
+                return await session.execute_write(self._run_in_transaction, statements)
+
+        except Exception as e:
+            raise GraphDBException(f"Error while executing write query for GraphDB")
+
+    async def setup(self):
+        # Creates the label-property indexes used by the name lookups.
+        labels = [COMMON_LABEL] + [entity.value for entity in EntityType]
+        statements = [
+            f"CREATE INDEX ON :`{COMMON_LABEL}`;",
+            f"CREATE INDEX ON :`{COMMON_LABEL}`(user_id);",
+        ]
+        for label in dict.fromkeys(labels):
+            statements.append(f"CREATE INDEX ON :`{label}`(name);")
+            statements.append(f"CREATE INDEX ON :`{label}`(name_norm);")
+
+        for statement in statements:
+            try:
+                # NOTE: Index creation can't run inside a managed transaction in Memgraph.
+                await self._execute_query(statement)
+            except Exception as e:
+                logger.warning(f"Could not run `{statement}`: {str(e)}")
+        logger.info(f"GraphDB indexes are set up.")
+
+    async def migrate_normalized_names(self, batch_size: int = 1000) -> int:
+        # Backfills the common label and `name_norm` on nodes written before they existed.
+        # NOTE: `toLower(trim(...))` matches `normalize_name` except for names with repeated
+        # inner whitespace, which the LLM extraction practically never produces.
+        try:
+            query = f"""
+            MATCH (n)
+            WHERE n.name IS NOT NULL AND (n.name_norm IS NULL OR NOT n:`{COMMON_LABEL}`)
+            WITH n LIMIT $batch_size
+            SET n:`{COMMON_LABEL}`, n.name_norm = toLower(trim(n.name))
+            RETURN count(n) AS updated
+            """
+            total = 0
+            while True:
+                res = await self._execute_write([(query, {"batch_size": batch_size})])
+                updated = res[0]["updated"] if res else 0
+                total += updated
+                if updated < batch_size:
+                    break
+
+            if total:
+                self._notify_node_change()
+                logger.info(f"Backfilled normalized names on {total} nodes.")
+            return total
+
+        except Exception as e:
+            raise GraphDBException(f"Error while backfilling normalized node names")
+
+    async def migrate_tenants(
+        self, default_user_id: str, batch_size: int = 1000
+    ) -> int:
+        # Assigns the nodes written before tenants existed to `default_user_id`.
+        try:
+            query = f"""
+            MATCH (n:`{COMMON_LABEL}`)
+            WHERE n.user_id IS NULL
+            WITH n LIMIT $batch_size
+            SET n.user_id = $user_id
+            RETURN count(n) AS updated
+            """
+            parameters = {"batch_size": batch_size, "user_id": default_user_id}
+            total = 0
+            while True:
+                res = await self._execute_write([(query, parameters)])
+                updated = res[0]["updated"] if res else 0
+                total += updated
+                if updated < batch_size:
+                    break
+
+            if total:
+                self._notify_node_change()
+                logger.info(f"Assigned {total} nodes to tenant {default_user_id}.")
+            return total
+
+        except Exception as e:
+            raise GraphDBException(f"Error while backfilling node tenant ids")
+
     def _normalize_dict(self, dct: Dict[str, Any]) -> Dict[str, Any]:
         new_dct = {}
         has_name = False
@@ -32,7 +192,10 @@ class GraphDBUtils:
         return new_dct
 
     async def add_node(
-        self, parameters: Dict[str, Any], entity: Optional[str] = "Entity"
+        self,
+        parameters: Dict[str, Any],
+        user_id: str,
+        entity: Optional[str] = "Entity",
     ):
         try:
             # NOTE: Each node must have `Entity` type. And the entity parameters should have name,
@@ -46,14 +209,17 @@ class GraphDBUtils:
             # query = f"CREATE (e:{entity} {params_for_query}) RETURN e"
 
             query = f"""
-            MERGE (e:`{entity}` {{name: $name}})
-            SET e += $props
+            MERGE (e:`{entity_safe}` {{user_id: $user_id, name: $name}})
+            SET e += $props, e:`{COMMON_LABEL}`, e.name_norm = $name_norm
             RETURN e
             """
-
-            await self._execute_query(
-                query=query, parameters={"name": node_name, "props": parameters}
-            )
+            parameters = {
+                "user_id": user_id,
+                "name": node_name,
+                "name_norm": normalize_name(node_name),
+                "props": parameters,
+            }
+            await self._execute_write([(query, parameters)])
 
         except Exception as e:
             raise GraphDBException(f"Error while adding new node in GraphDB")
@@ -63,6 +229,7 @@ class GraphDBUtils:
         node_1_name: str,
         node_2_name: str,
         relationship: str,
+        user_id: str,
         node_1_entity: Optional[str] = "Entity",
         node_2_entity: Optional[str] = "Entity",
     ):
@@ -72,18 +239,98 @@ class GraphDBUtils:
             node_2_entity_safe = node_2_entity.replace("`", "")
 
             query = f"""
-            MATCH (e1:`{node_1_entity_safe}` {{name: $node_1_name}})
-            MATCH (e2:`{node_2_entity_safe}` {{name: $node_2_name}})
+            MATCH (e1:`{node_1_entity_safe}` {{user_id: $user_id, name: $node_1_name}})
+            MATCH (e2:`{node_2_entity_safe}` {{user_id: $user_id, name: $node_2_name}})
             MERGE (e1)-[:`{relationship_safe}`]->(e2)
             """
-            parameters = {"node_1_name": node_1_name, "node_2_name": node_2_name}
-            await self._execute_query(query=query, parameters=parameters)
+            parameters = {
+                "user_id": user_id,
+                "node_1_name": node_1_name,
+                "node_2_name": node_2_name,
+            }
+            await self._execute_write([(query, parameters)])
 
         except Exception as e:
             raise GraphDBException(
                 f"Error while adding relationship between Node: {node_1_name} and Node: {node_2_name}"
             )
 
+    def _build_upsert_statements(
+        self,
+        triplets: List[GraphTriplets],
+        user_id: str,
+        node_embeddings: Optional[Dict[Tuple[str, str], List[float]]] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        node_embeddings = node_embeddings or {}
+        nodes_by_label: Dict[str, List[str]] = {}
+        rels_by_type: Dict[Tuple[str, str, str], List[Dict[str, str]]] = {}
+        for t in triplets:
+            subject_label = t.subject_type.replace("`", "")
+            object_label = t.object_type.replace("`", "")
+            relationship = t.predicate.upper().replace("`", "")
+
+            nodes_by_label.setdefault(subject_label, []).append(t.subject)
+            nodes_by_label.setdefault(object_label, []).append(t.object)
+            rels_by_type.setdefault(
+                (subject_label, relationship, object_label), []
+            ).append({"subject": t.subject, "object": t.object})
+
+        statements = []
+        for label, names in nodes_by_label.items():
+            # NOTE: `coalesce` keeps the stored embedding of nodes we have no new embedding for.
+            query = f"""
+            UNWIND $rows AS row
+            MERGE (e:`{label}` {{user_id: $user_id, name: row.name}})
+            SET e:`{COMMON_LABEL}`,
+                e.name_norm = row.name_norm,
+                e.embedding = coalesce(row.embedding, e.embedding)
+            """
+            rows = [
+                {
+                    "name": name,
+                    "name_norm": normalize_name(name),
+                    "embedding": node_embeddings.get((name, label)),
+                }
+                for name in dict.fromkeys(names)
+            ]
+            statements.append((query, {"rows": rows, "user_id": user_id}))
+
+        for (subject_label, relationship, object_label), rows in rels_by_type.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (e1:`{subject_label}` {{user_id: $user_id, name: row.subject}})
+            MATCH (e2:`{object_label}` {{user_id: $user_id, name: row.object}})
+            MERGE (e1)-[:`{relationship}`]->(e2)
+            """
+            statements.append((query, {"rows": rows, "user_id": user_id}))
+
+        return statements
+
+    async def upsert_triplets(
+        self,
+        triplets: List[GraphTriplets],
+        user_id: str,
+        node_embeddings: Optional[Dict[Tuple[str, str], List[float]]] = None,
+    ):
+        # Bulk version of `add_node` + `add_node` + `add_relationship` for already
+        # resolved triplets. Nodes are grouped by label and relationships by
+        # (label, type, label), and everything is applied in one write transaction.
+        # NOTE: Existing nodes are never renamed or merged here, so no listeners are notified.
+        try:
+            if not triplets:
+                return
+
+            statements = self._build_upsert_statements(
+                triplets, user_id, node_embeddings
+            )
+            await self._execute_write(statements)
+            logger.debug(
+                f"Upserted {len(triplets)} triplets with {len(statements)} statements."
+            )
+
+        except Exception as e:
+            raise GraphDBException(f"Error while upserting triplets in GraphDB")
+
     # async def find_node_by_name(self, name: str):
     #     try:
     #         name = name.lower()
@@ -94,74 +341,152 @@ class GraphDBUtils:
     #     except Exception as e:
     #         raise GraphDBException(f"Error while finding Node {name}")
 
-    async def find_node_by_relationship(self, name: str, relationship: str):
+    async def find_node_by_relationship(
+        self, name: str, relationship: str, user_id: str
+    ):
         try:
-            name = name.lower()
             relationship = relationship.upper()
             query = f"""
-            MATCH (e:Entity {{name: $name}})-[:{relationship}]->(rel_node:Entity)
+            MATCH (e:`{COMMON_LABEL}` {{name_norm: $name_norm}})-[:{relationship}]->(rel_node:`{COMMON_LABEL}`)
+            WHERE e.user_id = $user_id
             RETURN rel_node
             """
-            parameters = {"name": name}
-            return await self._execute_query(query=query, parameters=parameters)
+            parameters = {"name_norm": normalize_name(name), "user_id": user_id}
+            return await self._execute_read(query=query, parameters=parameters)
 
         except Exception as e:
             raise GraphDBException(
                 f"Error while finding nodes for Node {name} with relationship {relationship}"
             )
 
-    async def delete_node(self, name: str):
+    async def delete_node(self, name: str, user_id: str):
         try:
-            query = "MATCH (e:Entity {name: $name}) DETACH DELETE e"
-            parameters = {"name": name.lower()}
-            return await self._execute_query(query=query, parameters=parameters)
+            query = f"""
+            MATCH (e:`{COMMON_LABEL}` {{name_norm: $name_norm}})
+            WHERE e.user_id = $user_id
+            WITH e, [label IN labels(e) WHERE label <> $common_label] AS types
+            DETACH DELETE e
+            RETURN types
+            """
+            parameters = {
+                "name_norm": normalize_name(name),
+                "user_id": user_id,
+                "common_label": COMMON_LABEL,
+            }
+            res = await self._execute_write([(query, parameters)])
+            self._notify_node_change(name, user_id)
+            if self.entity_index is not None:
+                await self.entity_index.delete_entities(
+                    [
+                        (name, entity_type)
+                        for record in res
+                        for entity_type in record["types"]
+                    ],
+                    user_id,
+                )
+            return res
 
         except Exception as e:
             raise GraphDBException(f"Error while deleting Node {name}")
 
-    async def get_1_hop_neighborhood(self, name: str):
+    async def delete_all_nodes(self, user_id: str):
+        # Deletes every node (and relationship) of one tenant.
         try:
-            query = """
-            MATCH (center)
-            WHERE toLower(center.name) = toLower($name)
+            query = f"""
+            MATCH (e:`{COMMON_LABEL}`)
+            WHERE e.user_id = $user_id
+            DETACH DELETE e
+            """
+            res = await self._execute_write([(query, {"user_id": user_id})])
+            self._notify_node_change(user_id=user_id)
+            return res
+
+        except Exception as e:
+            raise GraphDBException(f"Error while deleting the nodes of {user_id}")
+
+    async def get_1_hop_neighborhood(self, name: str, user_id: str):
+        try:
+            query = f"""
+            MATCH (center:`{COMMON_LABEL}` {{name_norm: $name_norm}})
+            WHERE center.user_id = $user_id
             MATCH (center)-[r]-(neighbor)
             RETURN center.name, type(r) as relationship, neighbor.name, labels(neighbor) as types
             """
-            parameters = {"name": name}
-            return await self._execute_query(query, parameters)
+            parameters = {"name_norm": normalize_name(name), "user_id": user_id}
+            return await self._execute_read(query, parameters)
 
         except Exception as e:
             raise GraphDBException(f"Error retrieving neighborhood for {name}")
 
     async def delete_relationship(
-        self, node_1_name: str, node_2_name: str, relationship: str
+        self, node_1_name: str, node_2_name: str, relationship: str, user_id: str
     ):
         try:
             relationship = relationship.upper().replace(" ", "_")
             query = f"""
-            MATCH (e1 {{name: $n1}})-[r:{relationship}]->(e2 {{name: $n2}})
+            MATCH (e1:`{COMMON_LABEL}` {{user_id: $user_id, name: $n1}})-[r:{relationship}]->(e2:`{COMMON_LABEL}` {{user_id: $user_id, name: $n2}})
             DELETE r
             """
-            await self._execute_query(query, {"n1": node_1_name, "n2": node_2_name})
+            parameters = {"user_id": user_id, "n1": node_1_name, "n2": node_2_name}
+            await self._execute_write([(query, parameters)])
         except Exception as e:
             raise GraphDBException(f"Error deleting relationship: {e}")
 
-    async def search_similar_nodes(self, name: str, limit: int = 5) -> List[Dict]:
+    async def search_similar_nodes(
+        self, name: str, user_id: str, limit: int = 5
+    ) -> List[Dict]:
         try:
-            query = """
-            MATCH (n)
-            WHERE toLower(n.name) CONTAINS toLower($name)
+            # NOTE: CONTAINS can't use an index, but the scan is limited to the tenant's
+            # nodes and matching on the precomputed `name_norm` at least avoids
+            # lower-casing every name on every call.
+            query = f"""
+            MATCH (n:`{COMMON_LABEL}` {{user_id: $user_id}})
+            WHERE n.name_norm CONTAINS $name_norm
             RETURN n.name as name, labels(n) as labels
             LIMIT $limit
             """
-            return await self._execute_query(query, {"name": name, "limit": limit})
+            parameters = {
+                "name_norm": normalize_name(name),
+                "user_id": user_id,
+                "limit": limit,
+            }
+            return await self._execute_read(query, parameters)
+        except Exception as e:
+            return []
+
+    async def find_resolution_candidates(
+        self, names: List[str], user_id: str, limit: int = 5
+    ) -> List[Dict]:
+        # Batched `find_node_by_name` + `search_similar_nodes` for several names in one query.
+        # Returns, for every input name, whether a node with that exact name exists and
+        # the names of up to `limit` similar nodes.
+        try:
+            if not names:
+                return []
+
+            query = f"""
+            UNWIND $inputs AS input
+            OPTIONAL MATCH (exact:`{COMMON_LABEL}` {{name_norm: input.name_norm}})
+            WHERE exact.name = input.name AND exact.user_id = $user_id
+            WITH input, count(exact) > 0 AS exact_match
+            OPTIONAL MATCH (n:`{COMMON_LABEL}` {{user_id: $user_id}})
+            WHERE n.name_norm CONTAINS input.name_norm
+            WITH input, exact_match, collect(DISTINCT n.name)[..$limit] AS candidates
+            RETURN input.name AS input, exact_match, candidates
+            """
+            inputs = [
+                {"name": name, "name_norm": normalize_name(name)} for name in names
+            ]
+            parameters = {"inputs": inputs, "user_id": user_id, "limit": limit}
+            return await self._execute_read(query, parameters)
         except Exception as e:
             return []
 
-    async def get_2_hop_neighborhood(self, name: str, limit: int = 15):
+    async def get_2_hop_neighborhood(self, name: str, user_id: str, limit: int = 15):
         try:
-            query = """
-            MATCH (center) WHERE toLower(center.name) = toLower($name)
+            query = f"""
+            MATCH (center:`{COMMON_LABEL}` {{name_norm: $name_norm}})
+            WHERE center.user_id = $user_id
             MATCH (center)-[r1]-(n1)
             OPTIONAL MATCH (n1)-[r2]-(n2)
             WHERE n2 <> center 
@@ -173,13 +498,89 @@ class GraphDBUtils:
                 n2.name as target
             LIMIT $limit
             """
-            return await self._execute_query(query, {"name": name, "limit": limit})
+            parameters = {
+                "name_norm": normalize_name(name),
+                "user_id": user_id,
+                "limit": limit,
+            }
+            return await self._execute_read(query, parameters)
+        except Exception as e:
+            return []
+
+    async def get_neighborhoods(
+        self,
+        terms: List[str],
+        user_id: str,
+        per_term_limit: int = 5,
+        limit: int = 50,
+    ) -> List[Dict]:
+        # Batched `get_2_hop_neighborhood` for several (normalized) terms in a single query.
+        try:
+            if not terms:
+                return []
+
+            query = f"""
+            UNWIND $terms AS term
+            MATCH (center:`{COMMON_LABEL}` {{name_norm: term}})
+            WHERE center.user_id = $user_id
+            MATCH (center)-[r1]-(n1)
+            OPTIONAL MATCH (n1)-[r2]-(n2)
+            WHERE n2 <> center
+            WITH term, collect({{
+                source: center.name,
+                rel1: type(r1),
+                intermediate: n1.name,
+                rel2: type(r2),
+                target: n2.name
+            }})[..$per_term_limit] AS rows
+            UNWIND rows AS row
+            RETURN
+                term,
+                row.source as source,
+                row.rel1 as rel1,
+                row.intermediate as intermediate,
+                row.rel2 as rel2,
+                row.target as target
+            LIMIT $limit
+            """
+            parameters = {
+                "terms": terms,
+                "user_id": user_id,
+                "per_term_limit": per_term_limit,
+                "limit": limit,
+            }
+            return await self._execute_read(query, parameters)
         except Exception as e:
             return []
 
-    async def find_node_by_name(self, name: str):
+    async def get_nodes(self, skip: int = 0, limit: int = 256) -> List[Dict]:
         try:
-            query = "MATCH (e {name: $name}) RETURN e"
-            return await self._execute_query(query, {"name": name})
+            query = f"""
+            MATCH (n:`{COMMON_LABEL}`)
+            RETURN
+                n.name as name,
+                [label IN labels(n) WHERE label <> "{COMMON_LABEL}"] as labels,
+                n.user_id as user_id
+            ORDER BY n.user_id, n.name
+            SKIP $skip
+            LIMIT $limit
+            """
+            return await self._execute_read(query, {"skip": skip, "limit": limit})
+        except Exception as e:
+            raise GraphDBException(f"Error while listing nodes in GraphDB")
+
+    async def find_node_by_name(self, name: str, user_id: str):
+        try:
+            query = f"""
+            MATCH (e:`{COMMON_LABEL}` {{name_norm: $name_norm}})
+            WHERE e.name = $name AND e.user_id = $user_id
+            RETURN e
+            """
+            parameters = {
+                "name": name,
+                "name_norm": normalize_name(name),
+                "user_id": user_id,
+            }
+            return await self._execute_read(query, parameters)
         except Exception as e:
             return []
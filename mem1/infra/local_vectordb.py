@@ -0,0 +1,565 @@
+import asyncio
+from datetime import datetime
+import heapq
+import json
+import logging
+import numpy as np
+import os
+from qdrant_client import models
+from typing import Any, Dict, List, Optional, Tuple
+import uuid
+
+from .embedder import EmbedderUtils
+from .vectordb import DEFAULT_IMPORTANCE, VectorSearchException, dedupe_vectors
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalVectorDBUtils:
+    # In-process replacement for `VectorDBUtils` for small deployments. Vectors are
+    # kept L2-normalized in a memory-mapped matrix (one row per point), so a search
+    # is a single matrix-vector product. Payloads live in a JSON snapshot next to it,
+    # and every change since the snapshot is appended to a log, so a write costs O(1)
+    # instead of rewriting all the payloads. The log is folded into the snapshot once
+    # it's longer than the number of points.
+    # Returned points are Qdrant `ScoredPoint`s, so callers can't tell the two apart.
+    def __init__(
+        self,
+        path: str,
+        embedder: EmbedderUtils,
+        dtype: Optional[str] = "float32",
+        num_partitions: Optional[int] = 0,
+        num_probes: Optional[int] = 2,
+        grow_by: Optional[int] = 1024,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise VectorSearchException(f"Unsupported vector dtype: {dtype}")
+
+        self.path = path
+        self.embedder = embedder
+        self.dtype = np.dtype(dtype)
+        self.grow_by = grow_by
+
+        # Optional IVF-style partitioning: points are bucketed by their nearest
+        # centroid and a search only scores the `num_probes` closest buckets.
+        self.num_partitions = num_partitions or 0
+        self.num_probes = num_probes
+        self.min_points_per_partition = 32
+
+        self.vectors_path = os.path.join(path, f"vectors.{self.dtype.name}")
+        self.payloads_path = os.path.join(path, "payloads.json")
+        self.log_path = os.path.join(path, "payloads.log")
+        self.min_log_entries = 1024
+        self._log_entries = 0
+
+        self.dimension: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        # Point id -> row of every tenant's points, so reads only touch that tenant.
+        self._tenant_rows: Dict[Optional[str], Dict[str, int]] = {}
+        self._free_rows: List[int] = []
+
+        # (user_id, order_key) -> min-heap of (value, point_id), built on the first
+        # eviction by that key. Entries of removed points and outdated values (after
+        # `touch_points`) are skipped lazily, so an eviction is O(log N).
+        self._evict_heaps: Dict[Tuple[str, str], List[Tuple[Any, str]]] = {}
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._partitioned_size = 0
+
+        self._lock = asyncio.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.payloads_path) or not os.path.exists(
+            self.vectors_path
+        ):
+            return
+
+        with open(self.payloads_path) as f:
+            data = json.load(f)
+        self.dimension = data["dimension"]
+        self._ids = data["ids"]
+        self._payloads = data["payloads"]
+        self._replay_log()
+        for row, point_id in enumerate(self._ids):
+            if point_id is None:
+                self._free_rows.append(row)
+            else:
+                self._add_row(point_id, row)
+
+        self._open(os.path.getsize(self.vectors_path) // self._row_bytes)
+        logger.info(f"Loaded {len(self._rows)} points from {self.path}.")
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dimension * self.dtype.itemsize
+
+    def _open(self, capacity: int):
+        self._vectors = np.memmap(
+            self.vectors_path,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(capacity, self.dimension),
+        )
+        self._capacity = capacity
+
+    def _grow(self, min_capacity: int):
+        capacity = max(min_capacity, self._capacity + self.grow_by)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self._row_bytes)
+        self._open(capacity)
+
+        if self._assignments is not None:
+            self._assignments = np.pad(
+                self._assignments,
+                (0, capacity - len(self._assignments)),
+                constant_values=-1,
+            )
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+
+        with open(self.log_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # NOTE: Only the last line can be cut short (by a crash mid-write).
+                    break
+
+                self._log_entries += 1
+                match entry["op"]:
+                    case "set":
+                        row = entry["row"]
+                        if row >= len(self._ids):
+                            self._ids.extend([None] * (row + 1 - len(self._ids)))
+                            self._payloads.extend(
+                                [None] * (row + 1 - len(self._payloads))
+                            )
+                        self._ids[row] = entry["id"]
+                        self._payloads[row] = entry["payload"]
+                    case "del":
+                        self._ids[entry["row"]] = None
+                        self._payloads[entry["row"]] = None
+                    case "touch":
+                        for row in entry["rows"]:
+                            if self._payloads[row] is not None:
+                                self._payloads[row]["last_accessed"] = entry[
+                                    "timestamp"
+                                ]
+
+    def _append_log(self, entries: List[Dict[str, Any]]):
+        # The vectors go to disk first, so a logged point always has its vector.
+        if self._vectors is not None:
+            self._vectors.flush()
+
+        with open(self.log_path, "a") as f:
+            f.write(
+                "".join(
+                    json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries
+                )
+            )
+        self._log_entries += len(entries)
+
+        if self._log_entries > max(self.min_log_entries, len(self._rows)):
+            self._save()
+
+    def _save(self):
+        # Writes the full snapshot and starts a new log.
+        if self._vectors is not None:
+            self._vectors.flush()
+
+        tmp_path = f"{self.payloads_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "dimension": self.dimension,
+                    "ids": self._ids,
+                    "payloads": self._payloads,
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self.payloads_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._log_entries = 0
+
+    def _add_row(self, point_id: str, row: int):
+        user_id = self._payloads[row].get("user_id")
+        self._rows[point_id] = row
+        self._tenant_rows.setdefault(user_id, {})[point_id] = row
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def _insert(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
+        user_id: str,
+        session_id: Optional[str] = None,
+        importance: Optional[float] = None,
+    ):
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            # NOTE: The log doesn't repeat the dimension, the snapshot keeps it.
+            self._save()
+        elif vectors.shape[1] != self.dimension:
+            raise VectorSearchException(
+                f"Expected vectors of size {self.dimension}, got {vectors.shape[1]}."
+            )
+
+        current_timestamp = int(datetime.now().timestamp())
+        entries = []
+        for text, vector in zip(texts, vectors):
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                row = len(self._ids)
+                self._ids.append(None)
+                self._payloads.append(None)
+            if row >= self._capacity:
+                self._grow(row + 1)
+
+            point_id = str(uuid.uuid4())
+            self._vectors[row] = vector
+            self._ids[row] = point_id
+            self._payloads[row] = {
+                "text": text,
+                "user_id": user_id,
+                "session_id": session_id,
+                "timestamp": current_timestamp,
+                "last_accessed": current_timestamp,
+                "importance": DEFAULT_IMPORTANCE if importance is None else importance,
+            }
+            self._add_row(point_id, row)
+            self._push_evict_entries(point_id, row)
+            if self._centroids is not None:
+                self._assignments[row] = np.argmax(self._centroids @ vector)
+            entries.append(
+                {
+                    "op": "set",
+                    "row": row,
+                    "id": point_id,
+                    "payload": self._payloads[row],
+                }
+            )
+
+        self._append_log(entries)
+
+    def _push_evict_entries(self, point_id: str, row: int):
+        payload = self._payloads[row]
+        for (user_id, order_key), heap in self._evict_heaps.items():
+            if user_id == payload.get("user_id") and payload.get(order_key) is not None:
+                heapq.heappush(heap, (payload[order_key], point_id))
+
+    def _get_evict_heap(self, user_id: str, order_key: str) -> List[Tuple[Any, str]]:
+        tenant_rows = self._tenant_rows.get(user_id, {})
+        heap = self._evict_heaps.get((user_id, order_key))
+        # NOTE: Rebuilt when it's mostly stale entries, to keep its size bounded.
+        if heap is None or len(heap) > 2 * len(tenant_rows) + 64:
+            heap = [
+                (self._payloads[row][order_key], point_id)
+                for point_id, row in tenant_rows.items()
+                if self._payloads[row].get(order_key) is not None
+            ]
+            heapq.heapify(heap)
+            self._evict_heaps[(user_id, order_key)] = heap
+        return heap
+
+    def _remove(self, point_ids: List[str]) -> int:
+        entries = []
+        for point_id in point_ids:
+            row = self._rows.pop(str(point_id), None)
+            if row is None:
+                continue
+            user_id = self._payloads[row].get("user_id")
+            self._tenant_rows.get(user_id, {}).pop(str(point_id), None)
+            self._ids[row] = None
+            self._payloads[row] = None
+            self._free_rows.append(row)
+            entries.append({"op": "del", "row": row})
+
+        if entries:
+            self._append_log(entries)
+        return len(entries)
+
+    def _to_point(self, row: int, score: float = 0.0) -> models.ScoredPoint:
+        return models.ScoredPoint(
+            id=self._ids[row],
+            version=0,
+            score=score,
+            # NOTE: A copy, so callers can't change the stored payload behind the log.
+            payload=dict(self._payloads[row]),
+            vector=None,
+        )
+
+    def _live_rows(self, user_id: Optional[str] = None) -> np.ndarray:
+        rows = self._rows if user_id is None else self._tenant_rows.get(user_id, {})
+        return np.fromiter(rows.values(), dtype=np.int64, count=len(rows))
+
+    def _build_partitions(self, rows: np.ndarray, num_iters: int = 10):
+        # A few rounds of spherical k-means over the live points.
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        rng = np.random.default_rng(0)
+        centroids = vectors[
+            rng.choice(len(rows), size=self.num_partitions, replace=False)
+        ]
+        for _ in range(num_iters):
+            labels = np.argmax(vectors @ centroids.T, axis=1)
+            for k in range(self.num_partitions):
+                members = vectors[labels == k]
+                if len(members):
+                    centroids[k] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+
+        self._centroids = centroids
+        self._assignments = np.full(self._capacity, -1, dtype=np.int64)
+        self._assignments[rows] = np.argmax(vectors @ centroids.T, axis=1)
+        self._partitioned_size = len(rows)
+        logger.info(f"Built {self.num_partitions} partitions over {len(rows)} points.")
+
+    def _candidate_rows(self, query: np.ndarray, user_id: str) -> np.ndarray:
+        rows = self._live_rows(user_id)
+        if (
+            not self.num_partitions
+            or len(rows) < self.num_partitions * self.min_points_per_partition
+        ):
+            return rows
+
+        # Partitions are shared by all the tenants and rebuilt lazily once the
+        # store has doubled since the last build.
+        if self._centroids is None or len(self._rows) > 2 * self._partitioned_size:
+            self._build_partitions(self._live_rows())
+
+        probes = np.argsort(self._centroids @ query)[-self.num_probes :]
+        assignments = self._assignments[rows]
+        return rows[np.isin(assignments, probes) | (assignments < 0)]
+
+    def _search(
+        self, query: np.ndarray, user_id: str, limit: int
+    ) -> List[models.ScoredPoint]:
+        if not self._tenant_rows.get(user_id):
+            return []
+
+        query = self._normalize(np.asarray(query, dtype=np.float32))
+        rows = self._candidate_rows(query, user_id)
+        scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+
+        if limit < len(rows):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+
+        return [self._to_point(int(rows[i]), float(scores[i])) for i in top]
+
+    async def setup(self):
+        # Nothing to index, points are already grouped by tenant in memory.
+        return
+
+    async def migrate_tenants(self, default_user_id: str):
+        async with self._lock:
+            legacy_rows = self._tenant_rows.pop(None, {})
+            self._evict_heaps = {}
+            for point_id, row in legacy_rows.items():
+                self._payloads[row]["user_id"] = default_user_id
+                self._add_row(point_id, row)
+            if legacy_rows:
+                self._save()
+
+    async def store_point(
+        self,
+        text: str,
+        user_id: str,
+        session_id: Optional[str] = None,
+        importance: Optional[float] = None,
+    ):
+        try:
+            chunk_vector = await self.embedder.embed(text)
+            async with self._lock:
+                self._insert(
+                    [text], np.asarray([chunk_vector]), user_id, session_id, importance
+                )
+
+        except Exception as e:
+            logger.error(f"Error while storing memory in local vector store: {str(e)}")
+            raise VectorSearchException(
+                f"Error while storing memory in local vector store."
+            )
+
+    async def store_points(
+        self, text: List[str], user_id: str, session_id: Optional[str] = None
+    ):
+        try:
+            chunk_vector = await self.embedder.embed_batch(text)
+            async with self._lock:
+                self._insert(text, np.asarray(chunk_vector), user_id, session_id)
+
+        except Exception as e:
+            logger.error(
+                f"Error while storing memories in local vector store: {str(e)}"
+            )
+            raise VectorSearchException(
+                f"Error while storing memories in local vector store."
+            )
+
+    async def retrieve_point(self, text: str, user_id: str):
+        try:
+            text_emb = await self.embedder.embed(text)
+            search_results = self._search(text_emb, user_id, limit=1)
+
+            if search_results:
+                return search_results[0]
+            else:
+                return None
+
+        except Exception as e:
+            logger.error(
+                f"Error while retrieving memories in local vector store: {str(e)}"
+            )
+            raise VectorSearchException(
+                f"Error while retrieving memories in local vector store."
+            )
+
+    async def search_points(self, text: str, user_id: str, limit: int = 10):
+        try:
+            text_emb = await self.embedder.embed(text)
+            return self._search(text_emb, user_id, limit=limit)
+
+        except Exception as e:
+            logger.error(
+                f"Error while searching memories in local vector store: {str(e)}"
+            )
+            raise VectorSearchException(
+                f"Error while searching memories in local vector store."
+            )
+
+    async def retrieve_points(
+        self,
+        texts: List[str],
+        user_id: str,
+        dedupe_threshold: Optional[float] = 0.95,
+    ) -> Tuple[List[str], List]:
+        try:
+            if not texts:
+                return [], []
+
+            text_embs = np.asarray(
+                await self.embedder.embed_batch(texts), dtype=np.float32
+            )
+            kept = list(range(len(texts)))
+            if dedupe_threshold is not None:
+                kept = dedupe_vectors(texts, text_embs, dedupe_threshold)
+
+            kept_texts = [texts[i] for i in kept]
+            points = []
+            for i in kept:
+                search_results = self._search(text_embs[i], user_id, limit=1)
+                points.append(search_results[0] if search_results else None)
+            return kept_texts, points
+
+        except Exception as e:
+            logger.error(
+                f"Error while retrieving memories in local vector store: {str(e)}"
+            )
+            raise VectorSearchException(
+                f"Error while retrieving memories in local vector store."
+            )
+
+    async def retrieve_all_points(self, user_id: str):
+        all_points = [
+            self._to_point(row) for row in self._tenant_rows.get(user_id, {}).values()
+        ]
+        if all_points:
+            return all_points
+        else:
+            return None
+
+    async def count_points(self, user_id: str) -> int:
+        return len(self._tenant_rows.get(user_id, {}))
+
+    async def evict_point(self, user_id: str, order_key: str = "timestamp"):
+        try:
+            async with self._lock:
+                heap = self._get_evict_heap(user_id, order_key)
+                while heap:
+                    value, lowest_point_id = heap[0]
+                    row = self._tenant_rows.get(user_id, {}).get(lowest_point_id)
+                    if row is not None and self._payloads[row].get(order_key) == value:
+                        break
+                    heapq.heappop(heap)
+                else:
+                    return None
+
+                heapq.heappop(heap)
+                self._remove([lowest_point_id])
+                return lowest_point_id
+
+        except Exception as e:
+            logger.error(f"Error while evicting a point by {order_key}: {str(e)}")
+            raise VectorSearchException(f"Error while evicting a point.")
+
+    async def find_oldest_fact_and_delete(self, user_id: str):
+        return await self.evict_point(user_id, order_key="timestamp")
+
+    async def touch_points(self, point_ids: List, timestamp: int):
+        async with self._lock:
+            rows = []
+            for point_id in point_ids:
+                row = self._rows.get(str(point_id))
+                if row is not None:
+                    self._payloads[row]["last_accessed"] = timestamp
+                    self._push_evict_entries(str(point_id), row)
+                    rows.append(row)
+            if rows:
+                self._append_log(
+                    [{"op": "touch", "rows": rows, "timestamp": timestamp}]
+                )
+
+    async def delete_point(self, pnt) -> bool:
+        # Returns whether the point was still there to delete.
+        try:
+            async with self._lock:
+                return self._remove([pnt.id]) > 0
+
+        except Exception as e:
+            logger.error(f"Error while deleting a point: {str(e)}")
+            raise VectorSearchException(f"Error while deleting a point.")
+
+    async def delete_all_points(self, user_id: Optional[str] = None):
+        # Deletes the points of one tenant, or of everyone when `user_id` is None.
+        try:
+            logger.info(f"Clearing local vector store...")
+            async with self._lock:
+                if user_id is not None:
+                    self._remove(list(self._tenant_rows.pop(user_id, {})))
+                else:
+                    self._ids, self._payloads = [], []
+                    self._rows, self._free_rows = {}, []
+                    self._tenant_rows = {}
+                    self._evict_heaps = {}
+                    self._centroids = self._assignments = None
+                    self._partitioned_size = 0
+                    self._save()
+            logger.info("Deleted all the points from the local vector store.")
+
+        except Exception as e:
+            logger.error(f"Error while deleting all points: {str(e)}")
+            raise VectorSearchException(f"Error while deleting all points.")
@@ -1,8 +1,9 @@
 import asyncio
 from datetime import datetime
 import logging
+import numpy as np
 from qdrant_client import AsyncQdrantClient, models
-from typing import List
+from typing import List, Optional, Tuple
 import uuid
 
 from .embedder import EmbedderUtils
@@ -14,7 +15,42 @@ logger = logging.getLogger(__name__)
 class VectorSearchException(Exception): ...
 
 
+DEFAULT_IMPORTANCE = 0.5
+
+
+def dedupe_vectors(
+    texts: List[str], vectors: np.ndarray, threshold: float
+) -> List[int]:
+    # Indices of the texts to keep, dropping any text whose embedding is within
+    # `threshold` cosine similarity of an earlier kept one.
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = vectors / np.clip(norms, 1e-12, None)
+    similarities = normalized @ normalized.T
+
+    kept = []
+    for i in range(len(texts)):
+        if kept and np.max(similarities[i, kept]) >= threshold:
+            logger.debug(f"Dropping near-duplicate candidate: {texts[i]}")
+            continue
+        kept.append(i)
+
+    return kept
+
+
+def tenant_filter(user_id: str) -> models.Filter:
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="user_id",
+                match=models.MatchValue(value=user_id),
+            )
+        ]
+    )
+
+
 class VectorDBUtils:
+    # NOTE: All the facts live in one collection. Every point carries the `user_id`
+    # of its tenant (indexed as the tenant key) and every read is filtered on it.
     def __init__(
         self,
         vectordb_client: AsyncQdrantClient,
@@ -25,10 +61,77 @@ class VectorDBUtils:
         self.collection_name = vectordb_collection
         self.embedder = embedder
 
-    async def store_point(self, text: str):
+    async def setup(self):
+        # Payload indexes for the tenant keys and for the fields that eviction orders
+        # by, so neither filtering nor picking the point to evict scans the collection.
+        try:
+            for field_name, field_schema in (
+                (
+                    "user_id",
+                    models.KeywordIndexParams(
+                        type=models.KeywordIndexType.KEYWORD, is_tenant=True
+                    ),
+                ),
+                ("session_id", models.PayloadSchemaType.KEYWORD),
+                ("timestamp", models.PayloadSchemaType.INTEGER),
+                ("last_accessed", models.PayloadSchemaType.INTEGER),
+                ("importance", models.PayloadSchemaType.FLOAT),
+            ):
+                await self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                )
+
+        except Exception as e:
+            logger.error(f"Error while creating payload indexes: {str(e)}")
+            raise VectorSearchException(f"Error while creating payload indexes.")
+
+    async def migrate_tenants(self, default_user_id: str):
+        # Assigns the points written before tenants existed to `default_user_id`.
+        try:
+            await self.client.set_payload(
+                collection_name=self.collection_name,
+                payload={"user_id": default_user_id},
+                points=models.Filter(
+                    must=[
+                        models.IsEmptyCondition(
+                            is_empty=models.PayloadField(key="user_id")
+                        )
+                    ]
+                ),
+            )
+
+        except Exception as e:
+            logger.error(f"Error while backfilling tenant ids: {str(e)}")
+            raise VectorSearchException(f"Error while backfilling tenant ids.")
+
+    def _build_payload(
+        self,
+        text: str,
+        user_id: str,
+        session_id: Optional[str] = None,
+        importance: Optional[float] = None,
+    ) -> dict:
+        current_timestamp = int(datetime.now().timestamp())
+        return {
+            "text": text,
+            "user_id": user_id,
+            "session_id": session_id,
+            "timestamp": current_timestamp,
+            "last_accessed": current_timestamp,
+            "importance": DEFAULT_IMPORTANCE if importance is None else importance,
+        }
+
+    async def store_point(
+        self,
+        text: str,
+        user_id: str,
+        session_id: Optional[str] = None,
+        importance: Optional[float] = None,
+    ):
         try:
             chunk_id = str(uuid.uuid4())
-            current_timestamp = int(datetime.now().timestamp())
             chunk_vector = await self.embedder.embed(text)
             await self.client.upsert(
                 collection_name=self.collection_name,
@@ -36,10 +139,9 @@ class VectorDBUtils:
                     models.PointStruct(
                         id=chunk_id,
                         vector=chunk_vector,
-                        payload={
-                            "text": text,
-                            "timestamp": current_timestamp,
-                        },
+                        payload=self._build_payload(
+                            text, user_id, session_id, importance
+                        ),
                     )
                 ],
             )
@@ -48,20 +150,18 @@ class VectorDBUtils:
             logger.error(f"Error while storing memory in Vector DB:: {str(e)}")
             raise VectorSearchException(f"Error while storing memory in Vector DB.")
 
-    async def store_points(self, text: List[str]):
+    async def store_points(
+        self, text: List[str], user_id: str, session_id: Optional[str] = None
+    ):
         try:
             chunk_vector = await self.embedder.embed_batch(text)
             points_to_store = []
             for i, line in enumerate(text):
                 chunk_id = str(uuid.uuid4())
-                current_timestamp = int(datetime.now().timestamp())
                 point_to_store = models.PointStruct(
                     id=chunk_id,
                     vector=chunk_vector[i],
-                    payload={
-                        "text": line,
-                        "timestamp": current_timestamp,
-                    },
+                    payload=self._build_payload(line, user_id, session_id),
                 )
                 points_to_store.append(point_to_store)
 
@@ -74,19 +174,20 @@ class VectorDBUtils:
             logger.error(f"Error while storing memories in Vector DB: {str(e)}")
             raise VectorSearchException(f"Error while storing memories in Vector DB.")
 
-    async def retrieve_point(self, text: str):
+    async def retrieve_point(self, text: str, user_id: str):
         try:
             text_emb = await self.embedder.embed(text)
-            search_results = await self.client.search(
+            search_results = await self.client.query_points(
                 collection_name=self.collection_name,
-                query_vector=text_emb,
+                query=text_emb,
+                query_filter=tenant_filter(user_id),
                 limit=1,
                 with_payload=True,
                 with_vectors=False,
             )
 
-            if search_results:
-                return search_results[0]
+            if search_results.points:
+                return search_results.points[0]
             else:
                 return None
 
@@ -96,7 +197,69 @@ class VectorDBUtils:
                 f"Error while retrieving memories in Vector DB."
             )
 
-    async def retrieve_all_points(self):
+    async def search_points(self, text: str, user_id: str, limit: int = 10):
+        try:
+            text_emb = await self.embedder.embed(text)
+            search_results = await self.client.query_points(
+                collection_name=self.collection_name,
+                query=text_emb,
+                query_filter=tenant_filter(user_id),
+                limit=limit,
+                with_payload=True,
+                with_vectors=False,
+            )
+            return search_results.points
+
+        except Exception as e:
+            logger.error(f"Error while searching memories in Vector DB: {str(e)}")
+            raise VectorSearchException(f"Error while searching memories in Vector DB.")
+
+    async def retrieve_points(
+        self,
+        texts: List[str],
+        user_id: str,
+        dedupe_threshold: Optional[float] = 0.95,
+    ) -> Tuple[List[str], List]:
+        # Batched version of `retrieve_point`: one embedding call and one Qdrant call
+        # for all the texts. Near-identical texts are dropped before the lookup when
+        # `dedupe_threshold` is set. Returns the kept texts and their nearest point (or None).
+        try:
+            if not texts:
+                return [], []
+
+            text_embs = np.asarray(
+                await self.embedder.embed_batch(texts), dtype=np.float32
+            )
+            kept = list(range(len(texts)))
+            if dedupe_threshold is not None:
+                kept = dedupe_vectors(texts, text_embs, dedupe_threshold)
+
+            query_filter = tenant_filter(user_id)
+            search_results = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=text_embs[i].tolist(),
+                        filter=query_filter,
+                        limit=1,
+                        with_payload=True,
+                        with_vector=False,
+                    )
+                    for i in kept
+                ],
+            )
+
+            kept_texts = [texts[i] for i in kept]
+            points = [res.points[0] if res.points else None for res in search_results]
+            return kept_texts, points
+
+        except Exception as e:
+            logger.error(f"Error while retrieving memories in Vector DB: {str(e)}")
+            raise VectorSearchException(
+                f"Error while retrieving memories in Vector DB."
+            )
+
+    async def retrieve_all_points(self, user_id: str):
         try:
             all_points = []
             next_offset = None
@@ -104,6 +267,7 @@ class VectorDBUtils:
             while True:
                 res_points, next_offset = await self.client.scroll(
                     collection_name=self.collection_name,
+                    scroll_filter=tenant_filter(user_id),
                     limit=100,
                     offset=next_offset,
                     with_payload=True,
@@ -124,12 +288,28 @@ class VectorDBUtils:
                 f"Error while retrieving all memories in Vector DB."
             )
 
-    async def find_oldest_fact_and_delete(self):
+    async def count_points(self, user_id: str) -> int:
         try:
-            oldest_point, _ = await self.client.query_points(
+            res = await self.client.count(
                 collection_name=self.collection_name,
+                count_filter=tenant_filter(user_id),
+                exact=True,
+            )
+            return res.count
+
+        except Exception as e:
+            logger.error(f"Error while counting points: {str(e)}")
+            raise VectorSearchException(f"Error while counting points.")
+
+    async def evict_point(self, user_id: str, order_key: str = "timestamp"):
+        # Deletes the tenant's point with the lowest `order_key` payload value and
+        # returns its id. Points missing the key are never picked.
+        try:
+            lowest_points, _ = await self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=tenant_filter(user_id),
                 order_by=models.OrderBy(
-                    key="timestamp",
+                    key=order_key,
                     direction=models.Direction.ASC,
                 ),
                 limit=1,
@@ -137,45 +317,75 @@ class VectorDBUtils:
                 with_vectors=False,
             )
 
-            if oldest_points:
-                oldest_point_id = oldest_points[0].id
+            if lowest_points:
+                lowest_point_id = lowest_points[0].id
                 await self.client.delete(
                     collection_name=self.collection_name,
                     points_selector=models.PointIdsList(
-                        points=[oldest_point_id],
+                        points=[lowest_point_id],
                     ),
                 )
-                return oldest_point_id
+                return lowest_point_id
             else:
                 return None
 
         except Exception as e:
-            logger.error(f"Error while finding oldest fact and deleting it: {str(e)}")
-            raise VectorSearchException(
-                f"Error while finding oldest fact and deleting it."
+            logger.error(f"Error while evicting a point by {order_key}: {str(e)}")
+            raise VectorSearchException(f"Error while evicting a point.")
+
+    async def find_oldest_fact_and_delete(self, user_id: str):
+        return await self.evict_point(user_id, order_key="timestamp")
+
+    async def touch_points(self, point_ids: List, timestamp: int):
+        # Stamps the points as last retrieved at `timestamp`.
+        try:
+            if not point_ids:
+                return
+
+            await self.client.set_payload(
+                collection_name=self.collection_name,
+                payload={"last_accessed": timestamp},
+                points=list(point_ids),
             )
 
-    async def delete_point(self, pnt):
+        except Exception as e:
+            logger.error(f"Error while updating access stamps: {str(e)}")
+            raise VectorSearchException(f"Error while updating access stamps.")
+
+    async def delete_point(self, pnt) -> bool:
+        # Returns whether the point was still there to delete.
         try:
             pnt_id = pnt.id
-            rslt = await self.client.delete(
+            existing = await self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=[pnt_id],
+                with_payload=False,
+                with_vectors=False,
+            )
+            if not existing:
+                return False
+
+            await self.client.delete(
                 collection_name=self.collection_name,
                 points_selector=models.PointIdsList(
                     points=[pnt_id],
                 ),
             )
-            return rslt
+            return True
 
         except Exception as e:
             logger.error(f"Error while deleting a point: {str(e)}")
             raise VectorSearchException(f"Error while deleting a point.")
 
-    async def delete_all_points(self):
+    async def delete_all_points(self, user_id: Optional[str] = None):
+        # Deletes the points of one tenant, or of everyone when `user_id` is None.
         try:
             logger.info(f"Clearing collection...")
             res = await self.client.delete(
                 collection_name=self.collection_name,
-                points_selector=models.Filter(),
+                points_selector=(
+                    tenant_filter(user_id) if user_id is not None else models.Filter()
+                ),
             )
             logger.info("Deleted all the points from the collection.")
 
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(
+        self, max_size: Optional[int] = 1024, persist_path: Optional[str] = None
+    ):
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if self.persist_path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while self.max_size is not None and len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        keys = [key for key, value in self._data.items() if predicate(key, value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    # NOTE: Keys are stored as JSON lists, so only tuples of JSON-friendly values
+    # (or plain strings) survive a save/load round trip.
+    def save(self):
+        if not self.persist_path:
+            return
+
+        try:
+            items = [
+                [list(key) if isinstance(key, tuple) else key, value]
+                for key, value in self._data.items()
+            ]
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Saved {len(items)} cache entries to {self.persist_path}.")
+
+        except Exception as e:
+            logger.error(f"Error while saving cache to {self.persist_path}: {str(e)}")
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with open(self.persist_path) as f:
+                items = json.load(f)
+            for key, value in items:
+                self.set(tuple(key) if isinstance(key, list) else key, value)
+            logger.info(f"Loaded {len(items)} cache entries from {self.persist_path}.")
+
+        except Exception as e:
+            logger.error(
+                f"Error while loading cache from {self.persist_path}: {str(e)}"
+            )
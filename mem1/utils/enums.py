@@ -12,6 +12,24 @@ class FactComparisonResult(StrEnum):
     NONE = "NONE"
 
 
+class MemoryRetrievalMode(StrEnum):
+    ALL = "all"  # Every stored memory goes into the context.
+    TOP_K = "top_k"  # Only the memories most relevant to the latest user message.
+
+
+class MemoryInjectionMode(StrEnum):
+    SYSTEM_PROMPT = "system_prompt"  # Appended to the system message.
+    LATE_MESSAGE = "late_message"  # Tagged, at the start of the latest user message.
+
+
+class EvictionPolicy(StrEnum):
+    OLDEST = "oldest"  # Evict the fact that was stored first.
+    LEAST_RECENTLY_USED = "lru"  # Evict the fact that was retrieved least recently.
+    LOWEST_IMPORTANCE = (
+        "lowest_importance"  # Evict the fact with the lowest importance.
+    )
+
+
 class EntityType(StrEnum):
     PERSON = "Person"
     LOCATION = "Location"
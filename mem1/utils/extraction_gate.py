@@ -0,0 +1,206 @@
+import logging
+import numpy as np
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .models import Message
+
+if TYPE_CHECKING:
+    from ..infra.embedder import EmbedderUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+# A few messages that carry the kind of facts the extraction prompt looks for.
+FACT_EXEMPLARS = [
+    "My name is Alex and I work as a data engineer at Stripe.",
+    "I live in Berlin with my wife and our two kids.",
+    "I prefer Python over Java for backend work.",
+    "I'm building a side project called Atlas with FastAPI and Qdrant.",
+    "I'm allergic to peanuts and I don't eat meat.",
+    "My goal for this year is to get comfortable with Kubernetes.",
+    "I switched from VS Code to Neovim last month.",
+    "Our team deploys everything on AWS with Terraform.",
+]
+
+COURTESY_MESSAGES = frozenset(
+    """
+    ok okay k cool nice great thanks thank thx ty yes yeah yep no nope sure done
+    hi hello hey bye goodbye lol haha awesome perfect got it you welcome please
+    sounds good fine alright right correct wow hmm
+    """.split()
+)
+
+_CODE_FENCE_PATTERN = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+_CODE_LINE_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"[{}()\[\];]+|"  # Only brackets and semicolons.
+    r".*[;{]\s*$|"  # Statement or block endings.
+    r"(?:def|class|import|from|return|const|let|var|function|public|private|#include)\b.*|"
+    r"Traceback \(most recent call last\).*|File \".*\", line \d+.*|"
+    r"\w+(?:Error|Exception):.*"
+    r")$"
+)
+_SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]*")
+_WORD_PATTERN = re.compile(r"[A-Za-z][\w'+#.\-]*")
+_FIRST_PERSON = frozenset(
+    "i i'm im i've i'd i'll me my mine myself we we're we've our ours us".split()
+)
+_QUESTION_STARTS = frozenset(
+    """
+    what why how when where which who whom whose is are am was were do does did
+    can could should would will shall may might has have had isn't aren't don't
+    doesn't can't won't
+    """.split()
+)
+# Where a question or a request can carry a statement of its own, e.g.
+# "Can you remember (that) I'm vegan?" or "Fix this, my app uses Django."
+_CLAUSE_SPLIT_PATTERN = re.compile(
+    r"[,;:]|\b(?:that|because|since|as|so|but|while|although|though|remember|"
+    r"note|know)\b",
+    re.IGNORECASE,
+)
+_IMPERATIVE_STARTS = frozenset(
+    """
+    fix explain write show give tell help make convert translate summarize debug
+    refactor generate list create find check review rewrite add remove change
+    update optimize implement build run compare describe suggest continue try
+    """.split()
+)
+
+
+class ExtractionGate:
+    # Decides, before the candidate-fact LLM call, whether the latest user messages
+    # are worth extracting facts from. Local heuristics give each message a score:
+    # statements about the user (first person, also in clauses of questions and
+    # requests), named entities and plain statements count for it, while questions,
+    # commands, code and one-word replies don't.
+    # When the score is below `threshold`, an optional embedding check against a few
+    # fact-bearing exemplars gets the final say.
+    def __init__(
+        self,
+        threshold: Optional[float] = 0.4,
+        embedder: Optional["EmbedderUtils"] = None,
+        exemplars: Optional[List[str]] = None,
+        exemplar_threshold: Optional[float] = 0.5,
+    ):
+        self.threshold = threshold
+        self.embedder = embedder
+        self.exemplars = exemplars
+        self.exemplar_threshold = exemplar_threshold
+        self._exemplar_vectors: Optional[np.ndarray] = None
+
+        self.checked = 0
+        self.skipped = 0
+        self.passed_by_heuristics = 0
+        self.passed_by_exemplars = 0
+
+    def _strip_code(self, text: str) -> str:
+        text = _CODE_FENCE_PATTERN.sub("\n", text)
+        return "\n".join(
+            line for line in text.split("\n") if not _CODE_LINE_PATTERN.match(line)
+        )
+
+    def score(self, text: str) -> float:
+        prose = self._strip_code(text)
+        words = _WORD_PATTERN.findall(prose)
+        if not words or all(word.lower() in COURTESY_MESSAGES for word in words):
+            return 0.0
+
+        score = 0.0
+        has_statement = False
+        has_first_person = False
+        has_entity = False
+        for sentence in _SENTENCE_PATTERN.findall(prose):
+            sentence_words = _WORD_PATTERN.findall(sentence)
+            if not sentence_words:
+                continue
+
+            first_word = sentence_words[0].lower()
+            is_question = (
+                sentence.rstrip().endswith("?") or first_word in _QUESTION_STARTS
+            )
+            is_imperative = first_word in _IMPERATIVE_STARTS
+            if not (is_question or is_imperative):
+                has_statement = has_statement or len(sentence_words) >= 4
+                has_first_person = has_first_person or any(
+                    word.lower() in _FIRST_PERSON for word in sentence_words
+                )
+            else:
+                # NOTE: "Can I ..." or "Help me ..." aren't about the user, but a first
+                # person clause after the question or request itself usually is.
+                for clause in _CLAUSE_SPLIT_PATTERN.split(sentence)[1:]:
+                    has_first_person = has_first_person or any(
+                        word.lower() in _FIRST_PERSON
+                        for word in _WORD_PATTERN.findall(clause)
+                    )
+
+            # NOTE: Capitalised words that don't start the sentence are likely names.
+            has_entity = has_entity or any(
+                word[0].isupper() and word != "I" for word in sentence_words[1:]
+            )
+
+        if has_first_person:
+            score += 0.6
+        if has_entity:
+            score += 0.2
+        if has_statement:
+            score += 0.2
+        return min(score, 1.0)
+
+    async def _get_exemplar_vectors(self) -> np.ndarray:
+        if self._exemplar_vectors is None:
+            vectors = np.asarray(
+                await self.embedder.embed_batch(self.exemplars), dtype=np.float32
+            )
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            self._exemplar_vectors = vectors / np.maximum(norms, 1e-12)
+        return self._exemplar_vectors
+
+    async def _max_exemplar_similarity(self, texts: List[str]) -> float:
+        exemplar_vectors = await self._get_exemplar_vectors()
+        vectors = np.asarray(await self.embedder.embed_batch(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        return float((vectors @ exemplar_vectors.T).max())
+
+    async def should_extract(self, messages: List[Message]) -> bool:
+        self.checked += 1
+        texts = [msg.content for msg in messages if msg.role == "user" and msg.content]
+        scores = [self.score(text) for text in texts]
+
+        if scores and max(scores) >= self.threshold:
+            self.passed_by_heuristics += 1
+            return True
+
+        # NOTE: Messages without any prose (one-word replies, only code) are skipped
+        # without the embedding check.
+        uncertain = [text for text, score in zip(texts, scores) if score > 0]
+        if uncertain and self.embedder is not None and self.exemplars:
+            try:
+                similarity = await self._max_exemplar_similarity(uncertain)
+                if similarity >= self.exemplar_threshold:
+                    self.passed_by_exemplars += 1
+                    return True
+
+            except Exception as e:
+                # The gate must never lose facts because of the embedder.
+                logger.warning(f"Exemplar check failed, not skipping: {str(e)}")
+                self.passed_by_exemplars += 1
+                return True
+
+        self.skipped += 1
+        logger.info(
+            f"Skipping fact extraction (heuristic score {max(scores, default=0.0):.2f})."
+        )
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "passed_by_heuristics": self.passed_by_heuristics,
+            "passed_by_exemplars": self.passed_by_exemplars,
+            "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+        }
@@ -29,6 +29,27 @@ class FactsComparisonResultModel(BaseModel):
     )
 
 
+class FactComparisonDecision(BaseModel):
+    pair_id: int = Field(
+        ...,
+        description="The number of the (old fact, new candidate fact) pair this decision is for.",
+    )
+    result: Literal["ADD", "UPDATE", "NONE"] = Field(
+        ...,
+        description="The result of the comparison between the old fact and the new fact of the pair.",
+    )
+    fact: str = Field(
+        default="", description="The final fact that is to be stored in the Vector DB."
+    )
+
+
+class BatchFactsComparisonResultModel(BaseModel):
+    decisions: List[FactComparisonDecision] = Field(
+        default_factory=list,
+        description="One decision for every pair in the input.",
+    )
+
+
 class GraphTriplets(BaseModel):
     subject: str
     predicate: str
@@ -45,3 +66,21 @@ class GraphTriplets(BaseModel):
 
 class KnowledgeGraphExtraction(BaseModel):
     triplets: List[GraphTriplets]
+
+
+class EntityResolutionItem(BaseModel):
+    entity_id: int = Field(
+        ...,
+        description="The number of the input entity this resolution is for.",
+    )
+    resolved_name: str = Field(
+        ...,
+        description='The EXACT name of the existing option the entity refers to, or "NEW" if it refers to none of them.',
+    )
+
+
+class EntityResolutionBatch(BaseModel):
+    resolutions: List[EntityResolutionItem] = Field(
+        default_factory=list,
+        description="One resolution for every input entity.",
+    )
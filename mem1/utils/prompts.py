@@ -1,13 +1,9 @@
-import datetime
 from textwrap import dedent
 from typing import List, Optional
 
 from .models import Message
 
 
-current_time = datetime.datetime.now().strftime("%Y-%m-%d")
-
-
 SUMMARY_SYSTEM_PROMPT = dedent("""
 You are the **Mem1 Context Manager**, an advanced recursive summarization engine.
 
@@ -52,16 +48,19 @@ def get_summary_user_prompt(
     return prompt
 
 
-CANDIDATE_FACT_PROMPT = dedent(f"""
+# NOTE: Keep this prompt static (no per-call values like the date) so its tokens
+# can be served from the prefix cache. The current time is sent in the user message.
+CANDIDATE_FACT_PROMPT = dedent("""
 You are the **Mem1 Extraction Engine**. Your goal is to build a high-fidelity "User Profile" by observing conversation fragments.
 
 **Task:**
 Analyze the `Recent Messages` relative to the `Contextual Summary`. Extract **new, persistent facts** that should be stored in long-term memory.
 
 **Inputs:**
-1. **Current Time:** {current_time}
+1. **Current Time:** The date the messages were sent, for resolving relative dates.
 2. **Contextual Summary:** The user's known background (for resolving references).
-3. **Recent Messages:** The latest user input to analyze.
+3. **Earlier Messages (optional):** Already processed. Use them only to resolve references in the `Recent Messages`; never extract facts from them.
+4. **Recent Messages:** The latest user input to analyze.
 
 **Target Information Categories (Look for these):**
 1.  **Biographical:** Name, location, job title, company, education.
@@ -193,9 +192,49 @@ and the new fact associated with the command. The guidelines to choose the new f
 """)
 
 
+COMPARE_FACTS_BATCH_PROMPT = COMPARE_OLD_AND_NEW_FACT_PROMPT + dedent("""
+**Batch Mode:**
+
+You will receive multiple numbered pairs, each written as `PAIR <number>` followed by its [OLD FACT] and [NEW CANDIDATE FACT].
+
+* Apply the rules above to every pair independently. Never mix information between pairs.
+
+* Return exactly one decision per pair in `decisions`, with `pair_id` set to the number of that pair.
+
+* Example:
+
+    * PAIR 0: [OLD FACT]: "The user likes the color blue." [NEW FACT]: "The user is building a memory framework."
+
+    * PAIR 3: [OLD FACT]: "The user plays cricket." [NEW FACT]: "The user plays for team India."
+
+    * Output:
+        {
+            "decisions": [
+                {"pair_id": 0, "result": "ADD", "fact": "The user is building a memory framework."},
+                {"pair_id": 3, "result": "UPDATE", "fact": "The user plays cricket for team India."}
+            ]
+        }
+""")
+
+
 GRAPH_EXTRACTION_PROMPT = """
 You are a Knowledge Graph extraction expert.
 Analyze the given user fact and extract structured triplets (Subject, Predicate, Object).
 Classify the Subject and Object into these types: Person, Location, Org, Event, Project, Concept, Tool, Misc.
 Be concise.
 """
+
+
+ENTITY_RESOLUTION_BATCH_PROMPT = dedent("""
+You are an entity resolution engine for a Knowledge Graph.
+
+You will receive numbered input entities, each written as `ENTITY <number>: "<name>" (<type>)` followed by the `Existing Options` already stored in the graph.
+
+For every input entity decide whether it refers to one of its own `Existing Options` (e.g. "JS" and "JavaScript", "NYC" and "New York City").
+
+**Rules:**
+1. If it does, set `resolved_name` to the EXACT option name, character for character.
+2. If it refers to none of them, or you are unsure, set `resolved_name` to "NEW".
+3. Only pick from the options listed under that entity. Never mix options between entities.
+4. Return exactly one resolution per input entity, with `entity_id` set to the number of that entity.
+""")
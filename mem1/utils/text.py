@@ -0,0 +1,52 @@
+import re
+from typing import List
+
+
+STOP_WORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been
+    before being below between both but by can could did do does doing down during
+    each few for from further had has have having he her here hers herself him
+    himself his how i if in into is it its itself just let me more most my myself
+    no nor not now of off on once only or other our ours ourselves out over own
+    same she should so some such than that the their theirs them themselves then
+    there these they this those through to too under until up very was we were
+    what when where which while who whom why will with would you your yours
+    yourself yourselves also hey hi hello ok okay yes yeah please thanks thank
+    want need like know think tell give make get got use using used really
+    something anything everything thing things stuff going one two lot lots much
+    many way
+    """.split()
+)
+
+_TOKEN_PATTERN = re.compile(r"[\w][\w+#.\-']*")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.rstrip(".-'").lower() for token in _TOKEN_PATTERN.findall(text)]
+
+
+def extract_candidate_terms(
+    text: str, max_ngram: int = 3, min_length: int = 2
+) -> List[str]:
+    # Candidate entity names from a free-text query: every unigram that is not a stop word,
+    # plus n-grams (up to `max_ngram` words) that neither start nor end with a stop word,
+    # so that names like "Project Titan" or "Bank of America" can match.
+    tokens = tokenize(text)
+    terms = []
+    for n in range(max_ngram, 0, -1):
+        for i in range(len(tokens) - n + 1):
+            window = tokens[i : i + n]
+            if window[0] in STOP_WORDS or window[-1] in STOP_WORDS:
+                continue
+            term = " ".join(window)
+            if len(term) < min_length:
+                continue
+            terms.append(term)
+
+    # Longest n-grams come first, duplicates are dropped while keeping that order.
+    return list(dict.fromkeys(terms))
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).lower()
@@ -0,0 +1,29 @@
+import math
+import re
+from typing import List
+
+
+# NOTE: Rough local estimate (~4 chars or ~0.75 words per token for English text).
+# It is only used for budgeting, so being fast matters more than being exact.
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    by_chars = len(text) / 4
+    by_words = len(_WORD_PATTERN.findall(text)) * 0.75
+    return math.ceil(max(by_chars, by_words))
+
+
+def trim_to_token_budget(lines: List[str], budget: int) -> List[str]:
+    kept = []
+    used = 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1  # +1 for the newline joining the lines.
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+
+    return kept
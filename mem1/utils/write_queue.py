@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueException(Exception): ...
+
+
+class MemoryWriteQueue:
+    def __init__(
+        self,
+        process_fn: Callable[..., Awaitable[Any]],
+        num_workers: Optional[int] = 2,
+    ):
+        self.process_fn = process_fn
+        self.num_workers = max(1, num_workers or 1)
+
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        # Future of the last submitted op for every conversation that still has pending ops.
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._is_closed = False
+
+    def _start(self):
+        # NOTE: Workers are started lazily because they need a running event loop,
+        # which is usually not there yet when `Mem1` is constructed.
+        if self._workers:
+            return
+
+        for _ in range(self.num_workers):
+            queue = asyncio.Queue()
+            self._queues.append(queue)
+            self._workers.append(asyncio.create_task(self._worker(queue)))
+        logger.info(f"Started {self.num_workers} memory write workers.")
+
+    def _get_queue(self, conversation_id: str) -> asyncio.Queue:
+        # Every conversation always goes to the same worker, which keeps its ops in order.
+        shard = zlib.crc32(conversation_id.encode()) % self.num_workers
+        return self._queues[shard]
+
+    def submit(self, conversation_id: str, *args, **kwargs) -> asyncio.Future:
+        if self._is_closed:
+            raise WriteQueueException(
+                "Memory write queue is closed. Cannot submit new ops."
+            )
+
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[conversation_id] = future
+        self._get_queue(conversation_id).put_nowait(
+            (conversation_id, future, args, kwargs)
+        )
+        return future
+
+    def has_pending(self, conversation_id: str) -> bool:
+        return conversation_id in self._pending
+
+    def pending_conversations(self) -> List[str]:
+        return list(self._pending)
+
+    async def wait_for_pending(
+        self, conversation_id: str, timeout: Optional[float] = None
+    ) -> bool:
+        future = self._pending.get(conversation_id)
+        if future is None:
+            return True
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Timed out waiting for pending memory ops of conversation {conversation_id}."
+            )
+            return False
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                break
+
+            conversation_id, future, args, kwargs = item
+            try:
+                await self.process_fn(*args, **kwargs)
+            except Exception as e:
+                # NOTE: Nobody is awaiting the result of a background op, so the error
+                # is only logged. Readers waiting on it just stop waiting.
+                logger.error(
+                    f"Error in background memory op for conversation {conversation_id}: {repr(e)}"
+                )
+            finally:
+                if not future.done():
+                    future.set_result(None)
+                if self._pending.get(conversation_id) is future:
+                    del self._pending[conversation_id]
+                queue.task_done()
+
+    async def close(self, timeout: Optional[float] = None):
+        if self._is_closed:
+            return
+        self._is_closed = True
+
+        if not self._workers:
+            return
+
+        logger.info(f"Draining {len(self._pending)} conversations with pending ops.")
+        for queue in self._queues:
+            queue.put_nowait(None)
+
+        _, not_done = await asyncio.wait(self._workers, timeout=timeout)
+        for worker in not_done:
+            worker.cancel()
+        if not_done:
+            logger.warning(
+                f"Cancelled {len(not_done)} memory write workers that did not drain in time."
+            )
+        self._workers = []
+        self._queues = []